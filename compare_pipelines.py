@@ -0,0 +1,395 @@
+"""
+输出一致性对比工具：用同一批输入运行两套管线配置，验证更快的实现没有改变结果
+
+用法示例:
+    python compare_pipelines.py --in_raster edge_map --mask cropland --work_dir compare_out \
+        --config_a="" --config_b="<待验证配置的 main.py 参数>"
+
+    # 额外生成 3 景合成影像一起对比，并在不满足容差时返回非 0（可用于合并前的门禁）
+    python compare_pipelines.py --in_raster edge_map --mask cropland --synthetic 3 --min_iou 0.9
+
+    # 流水线模式回归检查：多波段堆栈输入下 --pipeline 与逐阶段运行的标签栅格必须完全相同
+    python compare_pipelines.py --synthetic 2 --synthetic_bands 3 --exact_labels \
+        --config_a="--fusion max" --config_b="--fusion max --pipeline"
+
+配置说明：config_a / config_b 为追加给 main.py 的参数字符串（以 --config_b="..." 形式传入，避免被当作选项解析）。
+每套配置在各自的输出目录中以 --keep 方式完整运行，并启用检查点以便比较剪枝骨架。
+
+对比内容：
+- 栅格: 剪枝骨架（检查点）与边界掩膜的像素一致率、地块标签的像素一致率（与标签编号无关）
+- 矢量: 按 IoU 一对一匹配的地块数、平均 IoU、地块数差异、对称差面积
+- 耗时: 两套配置的运行时间及加速比
+"""
+
+import argparse
+import json
+import shlex
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from osgeo import gdal, ogr, osr
+from scipy.ndimage import gaussian_filter
+
+ROOT = Path(__file__).resolve().parent
+MAIN_SCRIPT = ROOT / 'main.py'
+
+
+def make_synthetic_scene(edge_path, mask_path, size=1024, cell=64, seed=0, epsg=32650, bands=1):
+    """
+    生成一景合成场景：不规则网格地块的边缘概率图（边界为暗值）及对应的耕地掩膜。
+
+    Args:
+        edge_path (str): 输出边缘概率图路径（GeoTIFF）。
+        mask_path (str): 输出耕地掩膜路径（GeoTIFF）。
+        size (int): 影像边长（像素）。
+        cell (int): 地块平均边长（像素）。
+        seed (int): 随机种子。
+        epsg (int): 影像投影（默认 UTM 50N，像素大小 1 米）。
+        bands (int): 边缘概率图波段数。大于 1 时生成多波段堆栈（模拟多个模型 / TTA 输出）：
+            各波段噪声独立，且每个波段随机漏检一部分边界，mean / median / max 融合结果互不相同。
+    """
+    rng = np.random.default_rng(seed)
+
+    def cuts():
+        steps = rng.integers(cell // 2, cell * 3 // 2, size=size // max(cell // 2, 1) + 2)
+        positions = np.cumsum(steps)
+        return positions[positions < size]
+
+    rows, cols = cuts(), cuts()
+    boundary = np.zeros((size, size), dtype=bool)
+    for r in rows:
+        w = int(rng.integers(2, 5))
+        boundary[r:r + w, :] = True
+    for c in cols:
+        w = int(rng.integers(2, 5))
+        boundary[:, c:c + w] = True
+
+    def edge_band(dropped=None):
+        band_boundary = boundary if dropped is None else boundary & ~dropped
+        edge = np.where(band_boundary, 20.0, 230.0) + rng.normal(0, 10, size=(size, size))
+        return np.clip(gaussian_filter(edge, sigma=1.0), 0, 255).astype(np.uint8)
+
+    if bands > 1:
+        # 每个波段随机漏检约 1/4 的网格单元中的边界
+        tile_id = (np.arange(size)[:, None] // cell) * (size // cell + 1) + np.arange(size)[None, :] // cell
+        edge = np.stack([edge_band(rng.random(int(tile_id.max()) + 1)[tile_id] < 0.25) for _ in range(bands)])
+    else:
+        edge = edge_band()
+
+    # 每个网格单元随机标记为耕地/非耕地
+    row_id = np.searchsorted(rows, np.arange(size), side='right')
+    col_id = np.searchsorted(cols, np.arange(size), side='right')
+    is_crop = rng.random((len(rows) + 1, len(cols) + 1)) < 0.6
+    mask = is_crop[row_id[:, None], col_id[None, :]].astype(np.uint8)
+
+    srs = osr.SpatialReference()
+    srs.ImportFromEPSG(epsg)
+    gt = (500000.0, 1.0, 0.0, 4500000.0, 0.0, -1.0)
+    driver = gdal.GetDriverByName('GTiff')
+    for path, array in ((edge_path, edge), (mask_path, mask)):
+        array = array.reshape(-1, size, size)
+        ds = driver.Create(str(path), size, size, len(array), gdal.GDT_Byte)
+        ds.SetGeoTransform(gt)
+        ds.SetProjection(srs.ExportToWkt())
+        for b, band_array in enumerate(array, start=1):
+            ds.GetRasterBand(b).WriteArray(band_array)
+        ds.FlushCache()
+        ds = None
+
+
+def run_config(config_args, in_raster, mask, out_dir, checkpoint_dir, verbose=False):
+    """以给定配置运行完整管线，返回 (返回码, 耗时秒)。"""
+    cmd = [sys.executable, str(MAIN_SCRIPT),
+           '--in_raster', str(in_raster), '--mask', str(mask),
+           '--out_dir', str(out_dir), '--checkpoint_dir', str(checkpoint_dir), '--keep']
+    cmd += shlex.split(config_args)
+    if verbose:
+        print('[CMD] ', ' '.join(cmd))
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, shell=False)
+    return proc.returncode, time.perf_counter() - start
+
+
+def mask_agreement(a: np.ndarray, b: np.ndarray) -> dict:
+    """两张二值图的像素一致率及前景 IoU。"""
+    a, b = np.asarray(a) > 0, np.asarray(b) > 0
+    union = np.count_nonzero(a | b)
+    return {
+        'pixel_agreement': float(np.count_nonzero(a == b) / a.size),
+        'iou': float(np.count_nonzero(a & b) / union) if union else 1.0,
+    }
+
+
+def label_agreement(a: np.ndarray, b: np.ndarray) -> float:
+    """
+    两张标签图的像素一致率，与标签编号无关。
+
+    对每个标签取其在另一张图中重叠最多的标签，两个方向中较小的“被最佳匹配覆盖的前景像素占比”作为一致率。
+    """
+    a = np.asarray(a).astype(np.int64).ravel()
+    b = np.asarray(b).astype(np.int64).ravel()
+    foreground = np.count_nonzero((a > 0) | (b > 0))
+    if foreground == 0:
+        return 1.0
+    both = (a > 0) & (b > 0)
+    a, b = a[both], b[both]
+    if a.size == 0:
+        return 0.0
+
+    pairs, counts = np.unique(a * (int(b.max()) + 1) + b, return_counts=True)
+    la, lb = pairs // (int(b.max()) + 1), pairs % (int(b.max()) + 1)
+    best_a = np.zeros(int(la.max()) + 1, dtype=np.int64)
+    best_b = np.zeros(int(lb.max()) + 1, dtype=np.int64)
+    np.maximum.at(best_a, la, counts)
+    np.maximum.at(best_b, lb, counts)
+    return float(min(best_a.sum(), best_b.sum()) / foreground)
+
+
+def compare_rasters(out_a, out_b, ckpt_a, ckpt_b, base) -> dict:
+    """对比两套配置的剪枝骨架检查点和 thinning 标签栅格。"""
+    report = {}
+
+    skel_a, skel_b = ckpt_a / base / 'pruned_skeleton.npy', ckpt_b / base / 'pruned_skeleton.npy'
+    if skel_a.exists() and skel_b.exists():
+        a, b = np.load(skel_a, mmap_mode='r'), np.load(skel_b, mmap_mode='r')
+        if a.shape == b.shape:
+            report['skeleton'] = mask_agreement(a, b)
+        else:
+            report['skeleton'] = {'pixel_agreement': 0.0, 'iou': 0.0, 'error': f'shape {a.shape} != {b.shape}'}
+
+    tif_a, tif_b = out_a / f'{base}_origin.tif', out_b / f'{base}_origin.tif'
+    if tif_a.exists() and tif_b.exists():
+        a = gdal.Open(str(tif_a)).ReadAsArray()
+        b = gdal.Open(str(tif_b)).ReadAsArray()
+        if a.shape == b.shape:
+            report['boundary'] = mask_agreement(a == 0, b == 0)
+            report['label_agreement'] = label_agreement(a, b)
+            report['labels_identical'] = bool(np.array_equal(a, b))
+        else:
+            report['boundary'] = {'pixel_agreement': 0.0, 'iou': 0.0, 'error': f'shape {a.shape} != {b.shape}'}
+            report['label_agreement'] = 0.0
+            report['labels_identical'] = False
+    return report
+
+
+def _read_parcels(shp_path, target_epsg=None):
+    """读取地块几何（可选投影到目标坐标系，使面积单位为米；无效几何先修复），返回几何列表与包络数组。"""
+    ds = ogr.Open(str(shp_path))
+    if ds is None:
+        raise IOError(f"错误：无法打开输入文件 {shp_path}")
+    lyr = ds.GetLayer()
+    transform = None
+    if target_epsg:
+        target_srs = osr.SpatialReference()
+        target_srs.ImportFromEPSG(target_epsg)
+        transform = osr.CoordinateTransformation(lyr.GetSpatialRef(), target_srs)
+
+    geoms = []
+    for feat in lyr:
+        geom = feat.GetGeometryRef()
+        if geom is None or geom.IsEmpty():
+            continue
+        geom = geom.Clone()
+        if transform is not None:
+            geom.Transform(transform)
+        if not geom.IsValid():
+            # 平滑后的地块可能自相交，GEOS 对无效几何的叠加运算会返回 NULL
+            geom = geom.MakeValid() if hasattr(geom, 'MakeValid') else geom.Buffer(0)
+            if geom is None or geom.IsEmpty():
+                continue
+        geoms.append(geom)
+    ds = None
+    envelopes = np.array([g.GetEnvelope() for g in geoms], dtype=np.float64).reshape(-1, 4)  # minx, maxx, miny, maxy
+    return geoms, envelopes
+
+
+def compare_vectors(shp_a, shp_b, target_epsg=None, min_iou=0.5) -> dict:
+    """
+    按 IoU 一对一匹配两套结果中的地块。
+
+    候选对由包络相交筛选，按 IoU 从高到低贪心匹配；IoU 低于 min_iou 的地块视为未匹配。
+    对称差面积 = 匹配对的对称差面积 + 未匹配地块面积。
+    """
+    geoms_a, env_a = _read_parcels(shp_a, target_epsg)
+    geoms_b, env_b = _read_parcels(shp_b, target_epsg)
+
+    candidates = []
+    for i, env in enumerate(env_a):
+        hits = np.nonzero((env_b[:, 0] <= env[1]) & (env_b[:, 1] >= env[0]) &
+                          (env_b[:, 2] <= env[3]) & (env_b[:, 3] >= env[2]))[0]
+        for j in hits:
+            inter = geoms_a[i].Intersection(geoms_b[j])
+            if inter is None or inter.IsEmpty():
+                continue
+            inter_area = inter.GetArea()
+            union_area = geoms_a[i].GetArea() + geoms_b[j].GetArea() - inter_area
+            if union_area > 0:
+                candidates.append((inter_area / union_area, i, int(j), inter_area))
+
+    candidates.sort(reverse=True)
+    used_a, used_b, ious = set(), set(), []
+    symdiff_area = 0.0
+    for iou, i, j, inter_area in candidates:
+        if iou < min_iou:
+            break
+        if i in used_a or j in used_b:
+            continue
+        used_a.add(i)
+        used_b.add(j)
+        ious.append(iou)
+        # 对称差面积 = A + B - 2·交集，复用已算出的交集，不再单独做 SymDifference
+        symdiff_area += geoms_a[i].GetArea() + geoms_b[j].GetArea() - 2 * inter_area
+
+    symdiff_area += sum(g.GetArea() for k, g in enumerate(geoms_a) if k not in used_a)
+    symdiff_area += sum(g.GetArea() for k, g in enumerate(geoms_b) if k not in used_b)
+    total_area = sum(g.GetArea() for g in geoms_a)
+
+    return {
+        'count_a': len(geoms_a),
+        'count_b': len(geoms_b),
+        'count_diff': len(geoms_b) - len(geoms_a),
+        'matched': len(ious),
+        'match_rate': len(ious) / max(len(geoms_a), len(geoms_b), 1),
+        'mean_iou': float(np.mean(ious)) if ious else 0.0,
+        'symdiff_area': symdiff_area,
+        'symdiff_ratio': symdiff_area / total_area if total_area > 0 else 0.0,
+    }
+
+
+def check_tolerances(report: dict, args) -> list:
+    """按容差检查单景对比结果，返回不满足的条目描述。"""
+    failures = []
+    raster = report.get('raster', {})
+    if 'skeleton' in raster and raster['skeleton']['pixel_agreement'] < args.min_pixel_agreement:
+        failures.append(f"skeleton pixel_agreement {raster['skeleton']['pixel_agreement']:.6f} < {args.min_pixel_agreement}")
+    if 'boundary' in raster and raster['boundary']['pixel_agreement'] < args.min_pixel_agreement:
+        failures.append(f"boundary pixel_agreement {raster['boundary']['pixel_agreement']:.6f} < {args.min_pixel_agreement}")
+    if 'label_agreement' in raster and raster['label_agreement'] < args.min_label_agreement:
+        failures.append(f"label_agreement {raster['label_agreement']:.6f} < {args.min_label_agreement}")
+    if args.exact_labels and not raster.get('labels_identical', False):
+        failures.append('label rasters are not identical')
+    vector = report.get('vector')
+    if vector:
+        if vector['match_rate'] < args.min_match_rate:
+            failures.append(f"match_rate {vector['match_rate']:.6f} < {args.min_match_rate}")
+        if abs(vector['count_diff']) > args.max_count_diff:
+            failures.append(f"|count_diff| {abs(vector['count_diff'])} > {args.max_count_diff}")
+        if vector['symdiff_ratio'] > args.max_symdiff_ratio:
+            failures.append(f"symdiff_ratio {vector['symdiff_ratio']:.6f} > {args.max_symdiff_ratio}")
+    if report.get('error'):
+        failures.append(report['error'])
+    return failures
+
+
+def collect_scenes(args, work_dir: Path) -> list:
+    """收集待对比的 (edge_map, mask) 对：指定输入 + 合成场景。"""
+    scenes = []
+    if args.in_raster:
+        in_path = Path(args.in_raster)
+        rasters = sorted(p for p in in_path.iterdir() if p.suffix.lower() in ['.tif', '.tiff']) if in_path.is_dir() else [in_path]
+        mask_path = Path(args.mask)
+        for raster in rasters:
+            mask = mask_path / raster.name if mask_path.is_dir() else mask_path
+            scenes.append((raster, mask))
+
+    if args.synthetic > 0:
+        syn_edge, syn_mask = work_dir / 'synthetic' / 'edge_map', work_dir / 'synthetic' / 'cropland'
+        syn_edge.mkdir(parents=True, exist_ok=True)
+        syn_mask.mkdir(parents=True, exist_ok=True)
+        for k in range(args.synthetic):
+            name = f'synthetic_{k:02d}.tif' if args.synthetic_bands == 1 else f'synthetic_{k:02d}_b{args.synthetic_bands}.tif'
+            if not (syn_edge / name).exists():
+                make_synthetic_scene(syn_edge / name, syn_mask / name, size=args.synthetic_size, seed=args.seed + k,
+                                     bands=args.synthetic_bands)
+            scenes.append((syn_edge / name, syn_mask / name))
+    return scenes
+
+
+def main():
+    p = argparse.ArgumentParser(description='Compare two pipeline configurations for output equivalence')
+    p.add_argument('--in_raster', help='输入边缘概率图（文件或目录），可为空仅用合成场景', default=None)
+    p.add_argument('--mask', help='耕地掩膜（文件或目录）', default='cropland')
+    p.add_argument('--work_dir', help='对比工作目录', default='compare_out')
+    p.add_argument('--config_a', help='基准配置：追加给 main.py 的参数', default='')
+    p.add_argument('--config_b', help='待验证配置：追加给 main.py 的参数', default='')
+    p.add_argument('--synthetic', type=int, default=0, help='额外生成的合成场景数量')
+    p.add_argument('--synthetic_size', type=int, default=1024, help='合成场景边长（像素）')
+    p.add_argument('--synthetic_bands', type=int, default=1, help='合成边缘概率图的波段数（>1 时为多波段堆栈，用于验证融合）')
+    p.add_argument('--seed', type=int, default=0, help='合成场景随机种子')
+    p.add_argument('--target_utm_epsg', type=int, default=None, help='计算面积前投影到的 EPSG（默认使用图层原坐标）')
+    p.add_argument('--min_iou', type=float, default=0.5, help='地块匹配的最小 IoU')
+    p.add_argument('--min_pixel_agreement', type=float, default=0.999, help='骨架/边界像素一致率下限')
+    p.add_argument('--min_label_agreement', type=float, default=0.99, help='标签像素一致率下限')
+    p.add_argument('--min_match_rate', type=float, default=0.99, help='地块匹配率下限')
+    p.add_argument('--max_count_diff', type=int, default=0, help='地块数差异上限')
+    p.add_argument('--max_symdiff_ratio', type=float, default=0.01, help='对称差面积占比上限')
+    p.add_argument('--exact_labels', action='store_true', help='要求两套配置的 thinning 标签栅格逐像素完全相同')
+    p.add_argument('--report', help='以 JSON 保存对比报告的路径', default=None)
+    p.add_argument('--verbose', action='store_true', help='打印详细信息')
+    args = p.parse_args()
+
+    work_dir = Path(args.work_dir)
+    work_dir.mkdir(parents=True, exist_ok=True)
+    scenes = collect_scenes(args, work_dir)
+    if not scenes:
+        print('No scenes to compare: pass --in_raster and/or --synthetic')
+        sys.exit(2)
+
+    reports, all_failures = [], []
+    total_a = total_b = 0.0
+    for raster, mask in scenes:
+        base = raster.stem
+        dirs = {}
+        times = {}
+        for name, config in (('a', args.config_a), ('b', args.config_b)):
+            out_dir = work_dir / f'out_{name}'
+            ckpt_dir = work_dir / f'checkpoint_{name}'
+            # 每次对比都从头计算，避免检查点复用影响计时
+            for stale in (ckpt_dir / base).glob('*') if (ckpt_dir / base).exists() else []:
+                stale.unlink()
+            print(f"\n=== Running config {name.upper()} for {raster.name} ===")
+            rc, elapsed = run_config(config, raster, mask, out_dir, ckpt_dir, verbose=args.verbose)
+            dirs[name] = (out_dir, ckpt_dir, rc)
+            times[name] = elapsed
+
+        report = {'scene': str(raster), 'time_a': times['a'], 'time_b': times['b'],
+                  'speedup': times['a'] / times['b'] if times['b'] > 0 else float('inf')}
+        (out_a, ckpt_a, rc_a), (out_b, ckpt_b, rc_b) = dirs['a'], dirs['b']
+        if rc_a != 0 or rc_b != 0:
+            report['error'] = f'pipeline failed (config A rc={rc_a}, config B rc={rc_b})'
+        else:
+            total_a += times['a']
+            total_b += times['b']
+            report['raster'] = compare_rasters(out_a, out_b, ckpt_a, ckpt_b, base)
+            report['vector'] = compare_vectors(out_a / f'{base}.shp', out_b / f'{base}.shp',
+                                               target_epsg=args.target_utm_epsg, min_iou=args.min_iou)
+
+        failures = check_tolerances(report, args)
+        report['failures'] = failures
+        all_failures += [f'{raster.name}: {f}' for f in failures]
+        reports.append(report)
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    summary = {
+        'scenes': len(reports),
+        'time_a': total_a,
+        'time_b': total_b,
+        'speedup': total_a / total_b if total_b > 0 else float('inf'),
+        'passed': not all_failures,
+        'failures': all_failures,
+    }
+    print('\n=== Summary ===')
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({'summary': summary, 'scenes': reports}, f, ensure_ascii=False, indent=2)
+
+    sys.exit(0 if not all_failures else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,82 @@
-from osgeo import ogr, gdal
+from osgeo import ogr, gdal, osr
+from functools import lru_cache
 import numpy as np
 import os
 
-def filter_parcels_by_mask_gdal(parcel_shp, mask_tif, threshold=0.5, output_shp=None):
+
+def _align_mask_to_parcels(mask_ds, parcel_srs, target_resolution=None):
+    """
+    需要时为掩膜建立与地块图层坐标系对齐、北向朝上的 warp VRT 视图（不落盘）。
+
+    掩膜与地块同坐标系、北向朝上且未指定 target_resolution 时直接返回原数据集。
+    掩膜本身没有 NoData 时，warp 后影像范围外的像素以 255 标记为 NoData，不参与占比计算。
+    """
+    gt = mask_ds.GetGeoTransform()
+    north_up = gt[2] == 0 and gt[4] == 0
+    mask_srs = osr.SpatialReference(wkt=mask_ds.GetProjection()) if mask_ds.GetProjection() else None
+    same_srs = parcel_srs is None or mask_srs is None or parcel_srs.IsSame(mask_srs)
+    if same_srs and north_up and target_resolution is None:
+        return mask_ds
+
+    nodata = mask_ds.GetRasterBand(1).GetNoDataValue()
+    warp_kwargs = dict(format='VRT', resampleAlg='near', dstNodata=255 if nodata is None else nodata)
+    if parcel_srs is not None:
+        warp_kwargs['dstSRS'] = parcel_srs.ExportToWkt()
+    if target_resolution is not None:
+        warp_kwargs.update(xRes=target_resolution, yRes=target_resolution, targetAlignedPixels=True)
+    print("掩膜与地块坐标系/网格不一致，使用 warp VRT 在线对齐")
+    return gdal.Warp('', mask_ds, **warp_kwargs)
+
+
+def _cached_window_reader(band, block_size=256, cache_blocks=256):
+    """
+    返回按固定块读取并以 LRU 缓存的窗口读取函数，相邻地块复用同一批（warp 后的）掩膜块。
+
+    Returns:
+        (read_window, read_block)，read_window(xoff, yoff, xsize, ysize) 返回窗口数组，
+        read_block.cache_info() 可查看缓存命中情况。
+    """
+    xsize, ysize = band.XSize, band.YSize
+
+    @lru_cache(maxsize=cache_blocks)
+    def read_block(bx, by):
+        x0, y0 = bx * block_size, by * block_size
+        return band.ReadAsArray(x0, y0, min(block_size, xsize - x0), min(block_size, ysize - y0))
+
+    def read_window(xoff, yoff, win_xsize, win_ysize):
+        out = None
+        for by in range(yoff // block_size, (yoff + win_ysize - 1) // block_size + 1):
+            for bx in range(xoff // block_size, (xoff + win_xsize - 1) // block_size + 1):
+                block = read_block(bx, by)
+                if block is None:
+                    return None
+                if out is None:
+                    out = np.empty((win_ysize, win_xsize), dtype=block.dtype)
+                bx0, by0 = bx * block_size, by * block_size
+                x0, x1 = max(xoff, bx0), min(xoff + win_xsize, bx0 + block.shape[1])
+                y0, y1 = max(yoff, by0), min(yoff + win_ysize, by0 + block.shape[0])
+                out[y0 - yoff:y1 - yoff, x0 - xoff:x1 - xoff] = block[y0 - by0:y1 - by0, x0 - bx0:x1 - bx0]
+        return out
+
+    return read_window, read_block
+
+
+def filter_parcels_by_mask_gdal(parcel_shp, mask_tif, threshold=0.5, output_shp=None, target_resolution=None,
+                                cache_blocks=256):
+    """
+    按耕地掩膜过滤地块，保留耕地占比不低于 threshold 的地块。
+
+    掩膜可与地块坐标系、分辨率不同（见 _align_mask_to_parcels），掩膜按块读取并以 LRU 缓存（cache_blocks 个块）。
+    target_resolution 指定对齐后的掩膜分辨率（地块坐标系单位），默认由 GDAL 自动估算。
+    """
     shp_ds = ogr.Open(parcel_shp)
     shp_lyr = shp_ds.GetLayer()
-    mask_ds = gdal.Open(mask_tif)
+    src_mask_ds = gdal.Open(mask_tif)
+    mask_ds = _align_mask_to_parcels(src_mask_ds, shp_lyr.GetSpatialRef(), target_resolution)
     mask_band = mask_ds.GetRasterBand(1)
     gt = mask_ds.GetGeoTransform()
     nodata = mask_band.GetNoDataValue()
+    read_window, read_block = _cached_window_reader(mask_band, cache_blocks=cache_blocks)
 
     driver = ogr.GetDriverByName("ESRI Shapefile")
     if output_shp:
@@ -43,7 +111,7 @@ def filter_parcels_by_mask_gdal(parcel_shp, mask_tif, threshold=0.5, output_shp=
         if win_xsize <= 0 or win_ysize <= 0:
             continue
 
-        mask_array = mask_band.ReadAsArray(px_min, py_min, win_xsize, win_ysize)
+        mask_array = read_window(px_min, py_min, win_xsize, win_ysize)
         if mask_array is None:
             continue
 
@@ -76,22 +144,35 @@ def filter_parcels_by_mask_gdal(parcel_shp, mask_tif, threshold=0.5, output_shp=
         tmp_ds = None
         mem_ds = None
 
+    cache_info = read_block.cache_info()
+    print(f"掩膜块缓存：命中 {cache_info.hits} / 读取 {cache_info.misses}")
     print(f"✅ 过滤完成，输出地块数：{out_lyr.GetFeatureCount()}")
-    shp_ds, mask_ds = None, None
+    read_block.cache_clear()
+    shp_ds, mask_ds, src_mask_ds = None, None, None
     return out_ds
-if __name__ == '__main__':
+
+
+def cli_main(argv=None):
+    """按命令行参数运行耕地掩膜过滤。"""
     import argparse
     parser = argparse.ArgumentParser(description='Filter Parcels by Cropland Mask') 
     parser.add_argument('--parcel_shp', type=str, required=True, help='输入地块矢量文件（Shapefile）')
     parser.add_argument('--mask_tif', type=str, required=True, help='耕地掩膜文件（GeoTIFF）')
     parser.add_argument('--threshold', type=float, default=0.8, help='重叠比例阈值（0~1）')
     parser.add_argument('--output_shp', type=str, required=True, help='输出过滤后的地块矢量文件（Shapefile）')
-    args = parser.parse_args()
+    parser.add_argument('--target_resolution', type=float, default=None, help='掩膜对齐到地块坐标系后的分辨率（可选，默认自动估算）')
+    parser.add_argument('--cache_blocks', type=int, default=256, help='掩膜块 LRU 缓存的块数')
+    args = parser.parse_args(argv)
 
     filter_parcels_by_mask_gdal(
         args.parcel_shp,    
         args.mask_tif,
         threshold=args.threshold,
-        output_shp=args.output_shp
+        output_shp=args.output_shp,
+        target_resolution=args.target_resolution,
+        cache_blocks=args.cache_blocks
     )
 
+
+if __name__ == '__main__':
+    cli_main()
@@ -0,0 +1,141 @@
+"""
+多个边缘概率图的集成融合（多个模型检查点 / TTA 结果，或一个多波段堆栈）
+
+按行块流式读取所有成员并用累加器融合，内存占用与成员数无关，约为一景影像：
+- mean:   逐成员累加求均值
+- max:    逐像素取最大边缘概率。本仓库的边缘概率图为反相存储（边界为暗值，见 thinning.extract_ridge_mask），
+          因此对原始值逐成员取最小值，任一成员检出的边界都会保留
+- median: 逐块堆叠 k 个成员取中值（仅占用 k 个行块的内存）
+
+用法示例:
+    python fusion.py --in_rasters model_a.tif model_b.tif tta_stack.tif --method median --out_raster fused.tif
+"""
+
+import numpy as np
+from osgeo import gdal, osr
+
+FUSION_METHODS = ['mean', 'median', 'max']
+
+
+def same_grid(ds, ref_ds, tol=0.01):
+    """两个数据集是否为同一网格：尺寸、坐标系一致，四角坐标偏差小于 tol 个像素。"""
+    if (ds.RasterXSize, ds.RasterYSize) != (ref_ds.RasterXSize, ref_ds.RasterYSize):
+        return False
+    wkt, ref_wkt = ds.GetProjection(), ref_ds.GetProjection()
+    if bool(wkt) != bool(ref_wkt):
+        return False
+    if wkt and not osr.SpatialReference(wkt=wkt).IsSame(osr.SpatialReference(wkt=ref_wkt)):
+        return False
+    gt, ref_gt = ds.GetGeoTransform(), ref_ds.GetGeoTransform()
+    cols, rows = ref_ds.RasterXSize, ref_ds.RasterYSize
+    for px, py in ((0, 0), (cols, 0), (0, rows), (cols, rows)):
+        dx = (gt[0] + px * gt[1] + py * gt[2]) - (ref_gt[0] + px * ref_gt[1] + py * ref_gt[2])
+        dy = (gt[3] + px * gt[4] + py * gt[5]) - (ref_gt[3] + px * ref_gt[4] + py * ref_gt[5])
+        if abs(dx) > tol * abs(ref_gt[1]) or abs(dy) > tol * abs(ref_gt[5]):
+            return False
+    return True
+
+
+def _open_members(sources):
+    """打开所有输入，展开为 (数据集, 波段) 成员列表，并检查尺寸与网格一致。"""
+    datasets, members = [], []
+    for path in sources:
+        ds = gdal.Open(str(path))
+        if ds is None:
+            raise IOError(f"错误：无法打开输入文件 {path}")
+        datasets.append(ds)
+        for b in range(1, ds.RasterCount + 1):
+            members.append(ds.GetRasterBand(b))
+
+    cols, rows = datasets[0].RasterXSize, datasets[0].RasterYSize
+    for path, ds in zip(sources, datasets):
+        if (ds.RasterXSize, ds.RasterYSize) != (cols, rows):
+            raise ValueError(f"错误：成员尺寸不一致 {path}: {ds.RasterXSize}x{ds.RasterYSize} != {cols}x{rows}")
+        # 输出沿用第一个成员的网格，地理变换或坐标系不同的成员不能逐像素融合
+        if not same_grid(ds, datasets[0]):
+            raise ValueError(f"错误：成员网格（地理变换/坐标系）与 {sources[0]} 不一致: {path}")
+    return datasets, members, cols, rows
+
+
+def _fuse_block(members, method, xoff, yoff, cols, nrows):
+    """融合一个行块。"""
+    if method == 'median':
+        stack = np.stack([band.ReadAsArray(xoff, yoff, cols, nrows) for band in members])
+        return np.median(stack, axis=0)
+
+    acc = members[0].ReadAsArray(xoff, yoff, cols, nrows)
+    if method == 'mean':
+        acc = acc.astype(np.float32)
+    for band in members[1:]:
+        block = band.ReadAsArray(xoff, yoff, cols, nrows)
+        if method == 'mean':
+            acc += block
+        else:
+            # 边界为暗值：最大边缘概率对应最小像素值
+            np.minimum(acc, block, out=acc)
+    if method == 'mean':
+        acc /= len(members)
+    return acc
+
+
+def fuse_edge_maps(sources, method='mean', block_rows=256, out_raster=None):
+    """
+    融合多个边缘概率图。
+
+    Args:
+        sources (list[str]): 输入栅格路径，每个文件的所有波段都作为一个成员。
+        method (str): 融合方式，见 FUSION_METHODS。
+        block_rows (int): 每次读取的行数。
+        out_raster (str): 输出 GeoTIFF 路径（可选）。给定时逐块写盘并返回 None。
+
+    Returns:
+        与成员数据类型相同的融合结果数组（未给定 out_raster 时）。
+    """
+    if method not in FUSION_METHODS:
+        raise ValueError(f"错误：不支持的融合方式 {method}，可选 {FUSION_METHODS}")
+
+    datasets, members, cols, rows = _open_members(sources)
+    dtype = members[0].ReadAsArray(0, 0, 1, 1).dtype
+    print(f"融合 {len(members)} 个边缘概率图成员 (method={method})")
+
+    out_band, out_ds, fused = None, None, None
+    if out_raster:
+        ref = datasets[0]
+        out_ds = gdal.GetDriverByName('GTiff').Create(
+            out_raster, cols, rows, 1, members[0].DataType,
+            options=['TILED=YES', 'COMPRESS=DEFLATE', 'PREDICTOR=2', 'NUM_THREADS=ALL_CPUS', 'BIGTIFF=IF_SAFER'])
+        out_ds.SetGeoTransform(ref.GetGeoTransform())
+        out_ds.SetProjection(ref.GetProjection())
+        out_band = out_ds.GetRasterBand(1)
+    else:
+        fused = np.empty((rows, cols), dtype=dtype)
+
+    for yoff in range(0, rows, block_rows):
+        nrows = min(block_rows, rows - yoff)
+        block = _fuse_block(members, method, 0, yoff, cols, nrows)
+        if np.issubdtype(dtype, np.integer):
+            info = np.iinfo(dtype)
+            block = np.clip(np.rint(block), info.min, info.max)
+        block = block.astype(dtype, copy=False)
+        if out_band is not None:
+            out_band.WriteArray(block, 0, yoff)
+        else:
+            fused[yoff:yoff + nrows] = block
+
+    if out_ds is not None:
+        out_ds.FlushCache()
+        out_ds = None
+    datasets = None
+    return fused
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Edge Probability Map Ensemble Fusion')
+    parser.add_argument('--in_rasters', type=str, nargs='+', required=True, help='输入边缘概率图（可为多个文件或多波段堆栈）')
+    parser.add_argument('--out_raster', type=str, required=True, help='输出融合后的边缘概率图（GeoTIFF）')
+    parser.add_argument('--method', type=str, choices=FUSION_METHODS, default='mean', help='融合方式')
+    parser.add_argument('--block_rows', type=int, default=256, help='每次读取的行数')
+    args = parser.parse_args()
+
+    fuse_edge_maps(args.in_rasters, method=args.method, block_rows=args.block_rows, out_raster=args.out_raster)
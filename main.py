@@ -6,7 +6,9 @@
 
 支持参数：
 - --steps: 指定按逗号分隔的阶段, 可选值: thinning, vectorize, smooth, filter
-- --dry-run: 仅打印将运行的命令，不实际执行
+- --dry-run: 仅打印将运行的命令及每景的预计峰值内存/耗时，不实际执行
+- --jobs / --memory-budget: 并行处理多景，按预计峰值内存大景优先调度
+- --pipeline: 流水线模式，在进程内调用各阶段，预取/计算/写出三线程重叠
 - --verbose: 更详细的日志
 
 实现说明：优先尝试以模块导入方式调用脚本（如果脚本提供函数或 main），若不可用则使用 subprocess 以独立进程运行脚本文件。
@@ -41,6 +43,133 @@ def call_script(script_path: Path, args: list, dry_run=False, verbose=False):
     return run_command(cmd, dry_run=dry_run, verbose=verbose)
 
 
+def call_in_process(script_path: Path, args: list, verbose=False, **overrides):
+    """在当前进程中调用脚本的 cli_main，返回与子进程一致的返回码；overrides 透传给 cli_main。"""
+    import importlib
+    import traceback
+    if verbose:
+        print("[CALL] ", script_path.name, " ".join(args))
+    module = importlib.import_module(script_path.stem)
+    try:
+        module.cli_main(args, **overrides)
+    except SystemExit as e:
+        return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except Exception:
+        traceback.print_exc()
+        return 1
+    return 0
+
+
+# thinning 链路的逐像素成本系数（在 1024x1024 合成场景上用 tracemalloc / perf_counter 实测，按补边后的像素数计）：
+# - 峰值内存出现在脊线提取：int64 掩膜的开闭运算、距离变换（内部特征变换索引）与 Meijering 的 Hessian 中间数组，约 121 B/px；
+# - 可变宽度重建的 EDT（return_indices 的 int 索引数组 + 距离 + 半径图）约 49 B/px，剪枝约 19 B/px，标签与属性统计约 34 B/px；
+# - 此外常驻输入图、脊线掩膜、骨架和标签图。
+THINNING_PEAK_BYTES_PER_PIXEL = 125
+THINNING_SECONDS_PER_PIXEL = 2.5e-6
+# smooth / filter 及进程启动的成本与地块数相关，这里按像素粗略折算
+VECTOR_SECONDS_PER_PIXEL = 0.5e-6
+PROCESS_BASE_BYTES = 300 * 1024 ** 2
+
+
+def parse_memory_size(text):
+    """解析内存大小，如 '16G'、'800M'、'1.5T'；不带单位时按 GB 计。"""
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+    text = str(text).strip().upper().rstrip('B')
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(float(text) * units['G'])
+
+
+def format_bytes(n):
+    for unit in ['B', 'KB', 'MB', 'GB']:
+        if n < 1024:
+            return f'{n:.1f}{unit}'
+        n /= 1024
+    return f'{n:.1f}TB'
+
+
+def estimate_scene_cost(raster: Path, members=()):
+    """
+    按栅格尺寸与数据类型估算单景 thinning 链路的峰值内存（字节）与运行时间（秒）。
+
+    只读取文件头；文件无法打开时（如 dry-run 的示例路径）返回 0 成本并标记 known=False。
+    """
+    try:
+        from osgeo import gdal
+        ds = gdal.Open(str(raster))
+    except Exception:
+        ds = None
+    if ds is None:
+        return {'pixels': 0, 'peak_bytes': 0, 'input_bytes': 0, 'seconds': 0.0, 'known': False}
+
+    cols, rows = ds.RasterXSize, ds.RasterYSize
+    band = ds.GetRasterBand(1)
+    itemsize = gdal.GetDataTypeSize(band.DataType) // 8
+    n_members = ds.RasterCount + len(members)
+    ds = None
+
+    pixels = (cols + 2) * (rows + 2)  # thinning 四周各补 1 像素
+    # 输入图（融合时为融合结果）按原数据类型常驻；中值融合额外堆叠每个成员的一个行块（fusion.py 默认 256 行）
+    peak = PROCESS_BASE_BYTES + pixels * THINNING_PEAK_BYTES_PER_PIXEL + cols * rows * itemsize
+    if n_members > 1:
+        peak += n_members * 256 * cols * 8
+    seconds = pixels * (THINNING_SECONDS_PER_PIXEL + VECTOR_SECONDS_PER_PIXEL)
+    # 流水线模式预取的输入：（融合后的）边缘概率图 + 对齐到输入网格的 uint8 掩膜
+    input_bytes = cols * rows * (itemsize + 1)
+    return {'pixels': pixels, 'peak_bytes': peak, 'input_bytes': input_bytes, 'seconds': seconds, 'known': True}
+
+
+def estimate_pipelined_peak(order, costs):
+    """
+    估算 --pipeline 模式的峰值内存：thinning 第 N 景时同一进程中还持有预取的第 N+1 景输入。
+
+    第 N-1 景的 smooth / filter 同时在写出线程中运行，其内存与地块数相关，未计入估算。
+    """
+    peak = 0
+    for i, raster in enumerate(order):
+        prefetched = costs[order[i + 1]]['input_bytes'] if i + 1 < len(order) else 0
+        peak = max(peak, costs[raster]['peak_bytes'] + prefetched)
+    return peak
+
+
+def schedule_scenes(scenes, costs, run_scene, memory_budget=None, jobs=1, on_done=None):
+    """
+    并行运行场景：按给定顺序优先启动能放进剩余内存预算的场景，最多 jobs 个同时运行。
+
+    单个场景超过预算时在没有其他场景运行时独占执行。任一场景失败后不再启动新场景，
+    等待运行中的场景结束后返回第一个非 0 返回码。
+    """
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+    budget = memory_budget if memory_budget is not None else float('inf')
+    pending = list(scenes)
+    running = {}
+    first_rc = 0
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        while (pending and first_rc == 0) or running:
+            while pending and first_rc == 0 and len(running) < max(1, jobs):
+                used = sum(costs[r]['peak_bytes'] for r in running.values())
+                if not running and costs[pending[0]]['peak_bytes'] > budget:
+                    pick = pending[0]
+                    print(f'[WARN] {pick.name} 预计峰值内存 {format_bytes(costs[pick]["peak_bytes"])} 超过预算，单独运行')
+                else:
+                    pick = next((r for r in pending if used + costs[r]['peak_bytes'] <= budget), None)
+                if pick is None:
+                    break
+                pending.remove(pick)
+                running[pool.submit(run_scene, pick)] = pick
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                raster = running.pop(future)
+                rc = future.result()
+                if rc != 0 and first_rc == 0:
+                    first_rc = rc
+                if on_done:
+                    on_done(raster)
+    return first_rc
+
+
 
 def main():
     p = argparse.ArgumentParser(description='Cropplot post-processing pipeline entry')
@@ -51,6 +180,18 @@ def main():
     p.add_argument('--step', choices=['thinning', 'smooth', 'filter'], help='只运行单个阶段并退出')
     p.add_argument('--dry-run', action='store_true', help='只打印命令不执行')
     p.add_argument('--verbose', action='store_true', help='打印详细信息')
+    p.add_argument('--build_index', action='store_true', help='完成后为最终地块成果建立查询索引（parcel_index.py）')
+    p.add_argument('--pipeline', action='store_true', help='流水线模式：后台预取下一景输入、独立线程写出，使 I/O 与计算重叠')
+    p.add_argument('--jobs', type=int, default=1, help='同时处理的场景数（完整管线）')
+    p.add_argument('--memory-budget', type=parse_memory_size, default=None,
+                   help='同时运行场景的预计峰值内存上限（如 16G、800M），大景优先调度')
+    p.add_argument('--checkpoint_dir', help='thinning 中间结果检查点目录（按影像名分子目录），用于断点续跑', default=None)
+    p.add_argument('--compress', type=str.upper, choices=['DEFLATE', 'ZSTD', 'LZW', 'NONE'], default='DEFLATE', help='thinning 标签栅格压缩方式')
+    p.add_argument('--cog', action='store_true', help='thinning 标签栅格输出为 Cloud Optimized GeoTIFF')
+    p.add_argument('--threshold', type=float, default=0.8, help='耕地重叠比例阈值（0~1）')
+    p.add_argument('--ensemble', nargs='+', default=[], help='额外的边缘概率图目录（按同名文件与 --in_raster 集成融合后再 thinning）')
+    p.add_argument('--fusion', choices=['mean', 'median', 'max'], default='mean', help='集成融合方式')
+    p.add_argument('--fused_filter', action='store_true', help='在 thinning 的标签栅格上直接按耕地占比过滤，跳过 filter 阶段')
 
     # 额外通用参数，可传递给每个脚本（简单起见，作为未解析的字符串传下去）
     p.add_argument('--extra', help='额外参数，传递给每个脚本（示例: "--opt 1 --flag"）', default='')
@@ -90,6 +231,22 @@ def main():
         else:
             return str(mask_path)
 
+    # 估算每景成本（峰值内存 / 运行时间）
+    def ensemble_members_for(raster: Path):
+        return [Path(d) / raster.name for d in args.ensemble]
+
+    costs = {r: estimate_scene_cost(r, ensemble_members_for(r)) for r in rasters}
+    if args.dry_run or args.verbose:
+        print('Estimated cost per scene:')
+        for r in rasters:
+            c = costs[r]
+            if c['known']:
+                print(f"  {r.name}: {c['pixels']} px, peak ~{format_bytes(c['peak_bytes'])}, ~{c['seconds']:.1f}s")
+            else:
+                print(f"  {r.name}: unknown (raster not readable)")
+        if args.memory_budget is not None:
+            print(f'Memory budget: {format_bytes(args.memory_budget)}, jobs: {args.jobs}')
+
     # helper: 根据 raster 名称生成输出 shapefile 路径
     def outputs_for(raster: Path):
         base = raster.stem
@@ -98,6 +255,29 @@ def main():
         filter_out = out_dir / f'{base}.shp'
         return thinning_out, smooth_out, filter_out
 
+    # helper: thinning 的命令行参数（含集成成员、可选的检查点目录、用于地块属性的耕地掩膜和栅格输出选项）
+    def thinning_args_for(raster: Path, thinning_out: Path):
+        cmd_args = ['--in_raster', str(raster)]
+        # 集成成员：在每个 --ensemble 目录中查找同名文件
+        for member in ensemble_members_for(raster):
+            if not member.exists() and not args.dry_run:
+                print(f'ensemble member {member} not found for {raster.name}')
+                sys.exit(2)
+            cmd_args.append(str(member))
+        # 融合方式始终传递：多波段堆栈输入即使没有 --ensemble 也会在 thinning 中融合
+        cmd_args += ['--out_shp', str(thinning_out), '--fusion', args.fusion]
+        mask_for_raster = get_mask_for(raster)
+        if mask_for_raster:
+            cmd_args += ['--mask_tif', mask_for_raster]
+        if args.checkpoint_dir:
+            cmd_args += ['--checkpoint_dir', str(Path(args.checkpoint_dir) / raster.stem)]
+        cmd_args += ['--compress', args.compress]
+        if args.fused_filter:
+            cmd_args += ['--crop_threshold', str(args.threshold)]
+        if args.cog:
+            cmd_args.append('--cog')
+        return cmd_args
+
     # 尝试导入 tqdm，用于显示进度条；若不可用，回退到普通迭代
     try:
         from tqdm.auto import tqdm
@@ -115,7 +295,7 @@ def main():
 
             if step == 'thinning':
                 script = SCRIPTS['thinning']
-                cmd_args = ['--in_raster', str(raster), '--out_shp', str(thinning_out)]
+                cmd_args = thinning_args_for(raster, thinning_out)
                 if args.extra:
                     cmd_args += args.extra.split()
                 print(f"\n=== Running thinning (single-step) for {raster.name} ===")
@@ -151,7 +331,8 @@ def main():
                     print(f'filter requires smooth output {smooth_out} to exist')
                     sys.exit(2)
                 script = SCRIPTS['filter']
-                cmd_args = ['--parcel_shp', str(smooth_out), '--mask_tif', mask_for_raster, '--output_shp', str(filter_out)]
+                cmd_args = ['--parcel_shp', str(smooth_out), '--mask_tif', mask_for_raster, '--output_shp', str(filter_out),
+                    '--threshold', str(args.threshold)]
                 if args.extra:
                     cmd_args += args.extra.split()
                 print(f"\n=== Running filter (single-step) for {raster.name} ===")
@@ -163,47 +344,157 @@ def main():
                 continue
         return
 
-    # 固定顺序运行：对每个 raster 执行 thinning -> smooth -> filter
-    iterator = tqdm(rasters, desc='Processing (full)') if tqdm else rasters
-    for raster in iterator:
+    # 每景依次执行 thinning -> smooth -> filter，返回 [(阶段, 参数)]；缺少掩膜时返回 None
+    def scene_stages(raster: Path):
         thinning_out, smooth_out, filter_out = outputs_for(raster)
+        if not get_mask_for(raster):
+            step = 'fused filter' if args.fused_filter else 'filter step'
+            print(f'{step} needs --mask argument or matching mask for {raster.name}')
+            return None
+        if args.fused_filter:
+            # 融合过滤在 thinning 中完成，平滑结果即为最终输出
+            smooth_out = filter_out
+
+        extra = args.extra.split() if args.extra else []
+        stages = [
+            ('thinning', thinning_args_for(raster, thinning_out) + extra),
+            ('smooth', ['--input_shp', str(thinning_out), '--output_shp', str(smooth_out)] + extra),
+        ]
+        if not args.fused_filter:
+            stages.append(('filter', ['--parcel_shp', str(smooth_out), '--mask_tif', get_mask_for(raster),
+                                      '--output_shp', str(filter_out), '--threshold', str(args.threshold)] + extra))
+        return stages
+
+    # 固定顺序运行单景全部阶段，返回非 0 表示失败
+    def run_scene(raster: Path):
+        stages = scene_stages(raster)
+        if stages is None:
+            return 2
+        for step, cmd_args in stages:
+            print(f"\n=== Running {step} for {raster.name} ===")
+            rc = call_script(SCRIPTS[step], cmd_args, dry_run=args.dry_run, verbose=args.verbose)
+            if rc != 0:
+                print(f'{step} failed with code', rc)
+                return rc
+        return 0
+
+    # 流水线模式（--pipeline）：预取线程读取并解码下一景输入，主线程做 thinning，写出线程做 smooth/filter
+    def prefetch_scene(raster: Path):
+        from osgeo import gdal
+        from fusion import fuse_edge_maps
+        from thinning import read_mask_on_grid
+        ds = gdal.Open(str(raster))
+        if ds is None:
+            return {}  # 交给 thinning 报错
+        members = [raster] + ensemble_members_for(raster)
+        if len(members) > 1 or ds.RasterCount > 1:
+            inputs = {'edge_image': fuse_edge_maps([str(p) for p in members], method=args.fusion)}
+        else:
+            inputs = {'edge_image': ds.ReadAsArray()}
+
+        # 掩膜与 thinning 相同，先对齐到输入网格；无法对齐时不预取，交给 thinning 判断
         mask_for_raster = get_mask_for(raster)
+        if mask_for_raster:
+            mask_array, mask_nodata = read_mask_on_grid(mask_for_raster, ds)
+            if mask_array is not None:
+                inputs['mask_array'] = mask_array
+                inputs['mask_nodata'] = mask_nodata
+        ds = None
+        return inputs
+
+    def write_scene(raster: Path, stages):
+        for step, cmd_args in stages:
+            print(f"\n=== Running {step} for {raster.name} ===")
+            rc = call_in_process(SCRIPTS[step], cmd_args, verbose=args.verbose)
+            if rc != 0:
+                print(f'{step} failed with code', rc)
+                return rc
+        return 0
 
-        # 1) thinning
-        script = SCRIPTS['thinning']
-        cmd_args = ['--in_raster', str(raster), '--out_shp', str(thinning_out)]
-        if args.extra:
-            cmd_args += args.extra.split()
-        print(f"\n=== Running thinning for {raster.name} ===")
-        rc = call_script(script, cmd_args, dry_run=args.dry_run, verbose=args.verbose)
-        if rc != 0:
-            print('thinning failed with code', rc)
-            sys.exit(rc)
-
-        # 2) smooth
-        script = SCRIPTS['smooth']
-        cmd_args = ['--input_shp', str(thinning_out), '--output_shp', str(smooth_out)]
-        if args.extra:
-            cmd_args += args.extra.split()
-        print(f"\n=== Running smooth for {raster.name} ===")
-        rc = call_script(script, cmd_args, dry_run=args.dry_run, verbose=args.verbose)
-        if rc != 0:
-            print('smooth failed with code', rc)
-            sys.exit(rc)
-
-        # 3) filter
-        if not mask_for_raster:
-            print(f'filter step needs --mask argument or matching mask for {raster.name}')
-            sys.exit(2)
-        script = SCRIPTS['filter']
-        cmd_args = ['--parcel_shp', str(smooth_out), '--mask_tif', mask_for_raster, '--output_shp', str(filter_out)]
-        if args.extra:
-            cmd_args += args.extra.split()
-        print(f"\n=== Running filter for {raster.name} ===")
-        rc = call_script(script, cmd_args, dry_run=args.dry_run, verbose=args.verbose)
-        if rc != 0:
-            print('filter failed with code', rc)
-            sys.exit(rc)
+    def run_pipelined(order, on_done=None):
+        from concurrent.futures import ThreadPoolExecutor
+        rc = 0
+        with ThreadPoolExecutor(max_workers=1) as prefetcher, ThreadPoolExecutor(max_workers=1) as writer:
+            next_inputs = prefetcher.submit(prefetch_scene, order[0])
+            writing, writing_raster = None, None
+            for i, raster in enumerate(order):
+                try:
+                    inputs = next_inputs.result()
+                except Exception as e:
+                    print(f'[WARN] prefetch failed for {raster.name}: {e}')
+                    inputs = {}
+                # 双缓冲：当前景计算期间只预取下一景
+                if i + 1 < len(order):
+                    next_inputs = prefetcher.submit(prefetch_scene, order[i + 1])
+
+                stages = scene_stages(raster)
+                if stages is None:
+                    rc = 2
+                    break
+                step, cmd_args = stages[0]
+                print(f"\n=== Running {step} for {raster.name} ===")
+                rc = call_in_process(SCRIPTS[step], cmd_args, verbose=args.verbose, **inputs)
+                del inputs
+                if rc != 0:
+                    print(f'{step} failed with code', rc)
+                    break
+
+                # 上一景写出完成后再提交本景，写出线程最多落后一景
+                if writing is not None:
+                    rc = writing.result()
+                    writing = None
+                    if on_done:
+                        on_done(writing_raster)
+                    if rc != 0:
+                        break
+                writing, writing_raster = writer.submit(write_scene, raster, stages[1:]), raster
+
+            if writing is not None:
+                write_rc = writing.result()
+                if on_done:
+                    on_done(writing_raster)
+                rc = rc or write_rc
+        return rc
+
+    # 按内存预算调度：大景优先，同时运行的场景预计峰值内存之和不超过预算
+    scheduled = args.memory_budget is not None or args.jobs > 1
+    order = sorted(rasters, key=lambda r: costs[r]['peak_bytes'], reverse=True) if scheduled else rasters
+    if args.dry_run and scheduled:
+        print('Schedule order:', ', '.join(r.name for r in order))
+    progress = tqdm(total=len(order), desc='Processing (full)') if tqdm else None
+    on_done = (lambda raster: progress.update(1)) if progress else None
+    if args.pipeline and not args.dry_run:
+        if args.jobs > 1:
+            print('[WARN] --pipeline 按顺序处理场景，忽略 --jobs')
+        if args.memory_budget is not None:
+            # 流水线按顺序运行，预算只用于检查：预计峰值（含预取的下一景输入）超出时拒绝运行
+            pipelined_peak = estimate_pipelined_peak(order, costs)
+            if pipelined_peak > args.memory_budget:
+                print(f'[FATAL] --pipeline 预计峰值内存 ~{format_bytes(pipelined_peak)} 超过预算 '
+                      f'{format_bytes(args.memory_budget)}，请去掉 --pipeline 或调大预算')
+                sys.exit(1)
+            print(f'[WARN] --pipeline 不按 --memory-budget 调度，预计峰值 ~{format_bytes(pipelined_peak)}'
+                  f'（含预取的下一景输入，不含上一景的 smooth/filter）')
+        rc = run_pipelined(order, on_done=on_done)
+    else:
+        rc = schedule_scenes(order, costs, run_scene,
+                             memory_budget=args.memory_budget,
+                             jobs=1 if args.dry_run else args.jobs,
+                             on_done=on_done)
+    if progress:
+        progress.close()
+    if rc != 0:
+        sys.exit(rc)
+
+    # 为最终成果建立查询索引（保存在成果旁的 .pidx.npz）
+    if args.build_index:
+        finals = [outputs_for(r)[2] for r in rasters]
+        if args.dry_run:
+            print('[INDEX] ', ' '.join(str(f) for f in finals))
+        else:
+            from parcel_index import ParcelIndexStore
+            ParcelIndexStore(finals)
+            print(f'Built parcel indexes for {len(finals)} scene(s)')
 
     # 清理中间结果（如用户没有选择保留）
     if not args.keep and not args.dry_run:
@@ -229,7 +520,7 @@ def main():
             except Exception:
                 pass
 
-    print('\nPipeline finished successfully. Outputs:', filter_out)
+    print('\nPipeline finished successfully. Outputs:', outputs_for(rasters[-1])[2])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,390 @@
+"""
+地块查询接口：为最终地块成果（filter_by_cropland 输出）建立打包 STR 树索引
+
+- 每景成果 <base>.shp 旁保存 <base>.pidx.npz（包围盒树、WKB 几何、属性），再次加载无需扫描 shapefile；
+  shapefile 更新后索引自动重建。
+- ParcelIndexStore 管理多景索引：按景范围路由查询，已加载的景索引以 LRU 缓存。
+- 支持批量的点查询（包含该点的地块）、范围查询（与 bbox 相交的地块）和最近邻查询，
+  返回 {'scene', 'fid', 'attributes'}。坐标与距离均使用成果图层的坐标系（通常为 WGS84）。
+
+用法示例:
+    python parcel_index.py --build out_dir
+    python parcel_index.py --scenes out_dir --point 107.13 40.72 --bbox 107.12 40.71 107.14 40.73 --nearest 107.13 40.72
+"""
+
+import heapq
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+from osgeo import ogr
+
+INDEX_SUFFIX = '.pidx.npz'
+NODE_SIZE = 16
+
+
+def index_path_for(shp_path) -> Path:
+    shp_path = Path(shp_path)
+    return shp_path.with_name(shp_path.stem + INDEX_SUFFIX)
+
+
+def _source_fingerprint(shp_path):
+    st = os.stat(shp_path)
+    return np.array([st.st_size, st.st_mtime], dtype=np.float64)
+
+
+def _pack_str_tree(boxes: np.ndarray, node_size=NODE_SIZE):
+    """
+    Sort-Tile-Recursive 打包：叶子按 STR 排序，上层按连续 node_size 个子节点分组。
+
+    Args:
+        boxes (np.ndarray): (n, 4) 的包围盒 [minx, miny, maxx, maxy]。
+
+    Returns:
+        (order, level_boxes, level_offsets)：order 为叶子对应的地块下标；
+        level_boxes 为由叶子层到根层拼接的节点包围盒，level_offsets[i]:level_offsets[i+1] 为第 i 层。
+    """
+    n = len(boxes)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, 4)), np.array([0], dtype=np.int64)
+
+    cx = (boxes[:, 0] + boxes[:, 2]) / 2
+    cy = (boxes[:, 1] + boxes[:, 3]) / 2
+    n_leaf_nodes = int(np.ceil(n / node_size))
+    n_slices = int(np.ceil(np.sqrt(n_leaf_nodes)))
+    slice_size = n_slices * node_size
+
+    by_x = np.argsort(cx, kind='stable')
+    order = np.concatenate([s[np.argsort(cy[s], kind='stable')]
+                            for s in np.array_split(by_x, range(slice_size, n, slice_size))])
+
+    levels = [boxes[order]]
+    while len(levels[-1]) > 1:
+        child = levels[-1]
+        starts = np.arange(0, len(child), node_size)
+        levels.append(np.column_stack([
+            np.minimum.reduceat(child[:, 0], starts),
+            np.minimum.reduceat(child[:, 1], starts),
+            np.maximum.reduceat(child[:, 2], starts),
+            np.maximum.reduceat(child[:, 3], starts),
+        ]))
+    level_offsets = np.cumsum([0] + [len(level) for level in levels])
+    return order, np.concatenate(levels), level_offsets
+
+
+def build_scene_index(shp_path, index_path=None):
+    """
+    读取一景地块成果并保存索引文件，返回索引路径。
+    """
+    shp_path = Path(shp_path)
+    index_path = Path(index_path) if index_path else index_path_for(shp_path)
+    ds = ogr.Open(str(shp_path))
+    if ds is None:
+        raise IOError(f"错误：无法打开输入文件 {shp_path}")
+    lyr = ds.GetLayer()
+    srs = lyr.GetSpatialRef()
+
+    fids, attributes, wkbs, boxes = [], [], [], []
+    for feat in lyr:
+        geom = feat.GetGeometryRef()
+        if geom is None or geom.IsEmpty():
+            continue
+        minx, maxx, miny, maxy = geom.GetEnvelope()
+        fids.append(feat.GetFID())
+        attributes.append(feat.items())
+        wkbs.append(bytes(geom.ExportToWkb()))
+        boxes.append((minx, miny, maxx, maxy))
+    ds = None
+
+    boxes = np.array(boxes, dtype=np.float64).reshape(-1, 4)
+    order, level_boxes, level_offsets = _pack_str_tree(boxes)
+    wkb_offsets = np.cumsum([0] + [len(w) for w in wkbs]).astype(np.int64)
+    bounds = (np.array([boxes[:, 0].min(), boxes[:, 1].min(), boxes[:, 2].max(), boxes[:, 3].max()])
+              if len(boxes) else np.full(4, np.nan))
+
+    tmp_path = index_path.with_name(index_path.name + '.tmp.npz')
+    np.savez(
+        tmp_path,
+        bounds=bounds,
+        source=_source_fingerprint(shp_path),
+        fids=np.array(fids, dtype=np.int64),
+        order=order,
+        level_boxes=level_boxes,
+        level_offsets=level_offsets,
+        wkb=np.frombuffer(b''.join(wkbs), dtype=np.uint8),
+        wkb_offsets=wkb_offsets,
+        attributes=np.array(json.dumps(attributes, ensure_ascii=False, default=str)),
+        srs=np.array(srs.ExportToWkt() if srs is not None else ''),
+    )
+    os.replace(tmp_path, index_path)
+    return index_path
+
+
+def _box_distance(boxes, x, y):
+    """点到包围盒的最小距离（点在盒内为 0）。"""
+    dx = np.maximum(np.maximum(boxes[:, 0] - x, 0), x - boxes[:, 2])
+    dy = np.maximum(np.maximum(boxes[:, 1] - y, 0), y - boxes[:, 3])
+    return np.hypot(dx, dy)
+
+
+class SceneIndex:
+    """单景地块索引（只读）。"""
+
+    def __init__(self, index_path, scene=None):
+        self.scene = scene or Path(index_path).name[:-len(INDEX_SUFFIX)]
+        # 数组全部一次读入并关闭文件，避免 Windows 上重建索引时 os.replace 因文件占用失败
+        with np.load(index_path) as data:
+            self.bounds = data['bounds']
+            self.fids = data['fids']
+            self.order = data['order']
+            self.level_boxes = data['level_boxes']
+            self.level_offsets = data['level_offsets']
+            self.wkb = data['wkb']
+            self.wkb_offsets = data['wkb_offsets']
+            self.attributes = json.loads(str(data['attributes']))
+            self.srs_wkt = str(data['srs'])
+        self._geoms = {}
+
+    def __len__(self):
+        return len(self.fids)
+
+    def _level(self, i):
+        return self.level_boxes[self.level_offsets[i]:self.level_offsets[i + 1]]
+
+    def geometry(self, i):
+        """第 i 个地块的几何（按需从 WKB 解码并缓存）。"""
+        geom = self._geoms.get(i)
+        if geom is None:
+            geom = ogr.CreateGeometryFromWkb(self.wkb[self.wkb_offsets[i]:self.wkb_offsets[i + 1]].tobytes())
+            self._geoms[i] = geom
+        return geom
+
+    def result(self, i):
+        return {'scene': self.scene, 'fid': int(self.fids[i]), 'attributes': self.attributes[i]}
+
+    def search_boxes(self, qboxes):
+        """
+        批量包围盒检索：逐层展开与查询框相交的节点。
+
+        Returns:
+            (query_idx, parcel_idx)：包围盒相交的 (查询, 地块) 对。
+        """
+        qboxes = np.asarray(qboxes, dtype=np.float64).reshape(-1, 4)
+        n_levels = len(self.level_offsets) - 1
+        if len(self) == 0 or len(qboxes) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+        top = n_levels - 1
+        q = np.repeat(np.arange(len(qboxes)), len(self._level(top)))
+        nodes = np.tile(np.arange(len(self._level(top))), len(qboxes))
+        for level in range(top, -1, -1):
+            boxes = self._level(level)
+            if level < top:
+                # 展开上一层命中节点的子节点
+                child = nodes[:, None] * NODE_SIZE + np.arange(NODE_SIZE)[None, :]
+                valid = child < len(boxes)
+                q = np.broadcast_to(q[:, None], child.shape)[valid]
+                nodes = child[valid]
+            b, qb = boxes[nodes], qboxes[q]
+            hit = (b[:, 0] <= qb[:, 2]) & (b[:, 2] >= qb[:, 0]) & (b[:, 1] <= qb[:, 3]) & (b[:, 3] >= qb[:, 1])
+            q, nodes = q[hit], nodes[hit]
+        return q, self.order[nodes]
+
+    def query_points(self, points):
+        """批量点查询：返回每个点所在地块的列表（边界上的点计入相邻地块）。"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        results = [[] for _ in range(len(points))]
+        q, idx = self.search_boxes(np.hstack([points, points]))
+        for qi, i in zip(q, idx):
+            pt = ogr.Geometry(ogr.wkbPoint)
+            pt.AddPoint_2D(float(points[qi, 0]), float(points[qi, 1]))
+            if self.geometry(i).Intersects(pt):
+                results[qi].append(self.result(i))
+        return results
+
+    def query_bboxes(self, bboxes, exact=True):
+        """批量范围查询 [minx, miny, maxx, maxy]；exact 为 False 时只比较包围盒。"""
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        results = [[] for _ in range(len(bboxes))]
+        q, idx = self.search_boxes(bboxes)
+        for qi, i in zip(q, idx):
+            if exact:
+                minx, miny, maxx, maxy = bboxes[qi]
+                ring = ogr.Geometry(ogr.wkbLinearRing)
+                for x, y in ((minx, miny), (maxx, miny), (maxx, maxy), (minx, maxy), (minx, miny)):
+                    ring.AddPoint_2D(float(x), float(y))
+                rect = ogr.Geometry(ogr.wkbPolygon)
+                rect.AddGeometry(ring)
+                if not self.geometry(i).Intersects(rect):
+                    continue
+            results[qi].append(self.result(i))
+        return results
+
+    def nearest(self, x, y, k=1, max_distance=np.inf):
+        """
+        单点最近邻：按包围盒距离做最优优先搜索，叶子用几何精确距离。
+
+        Returns:
+            [(距离, 地块下标)]，按距离升序，最多 k 个。
+        """
+        if len(self) == 0:
+            return []
+        pt = ogr.Geometry(ogr.wkbPoint)
+        pt.AddPoint_2D(float(x), float(y))
+        top = len(self.level_offsets) - 2
+        top_boxes = self._level(top)
+        heap = [(d, top, j) for j, d in enumerate(_box_distance(top_boxes, x, y))]
+        heapq.heapify(heap)
+        found = []
+        while heap:
+            d, level, j = heapq.heappop(heap)
+            if d > max_distance or (len(found) == k and d > -found[0][0]):
+                break
+            if level == -1:
+                # 精确距离项
+                heapq.heappush(found, (-d, j))
+                if len(found) > k:
+                    heapq.heappop(found)
+                continue
+            if level == 0:
+                i = int(self.order[j])
+                heapq.heappush(heap, (self.geometry(i).Distance(pt), -1, i))
+                continue
+            children = self._level(level - 1)
+            child = np.arange(j * NODE_SIZE, min((j + 1) * NODE_SIZE, len(children)))
+            for c, cd in zip(child, _box_distance(children[child], x, y)):
+                heapq.heappush(heap, (cd, level - 1, int(c)))
+        return sorted((-nd, i) for nd, i in found)
+
+
+def _collect_shapefiles(targets):
+    """展开目录与文件列表为最终成果 shapefile 列表（目录中跳过 *_origin / *_smooth 中间结果）。"""
+    if isinstance(targets, (str, os.PathLike)):
+        targets = [targets]
+    shapefiles = []
+    for target in map(Path, targets):
+        if target.is_dir():
+            shapefiles += sorted(p for p in target.glob('*.shp') if not p.stem.endswith(('_origin', '_smooth')))
+        else:
+            shapefiles.append(target)
+    return shapefiles
+
+
+class ParcelIndexStore:
+    """
+    多景地块索引：按景范围路由查询，已加载的景索引以 LRU 缓存。
+
+    Args:
+        shapefiles: 各景最终成果 shapefile 路径或目录（的列表），目录中自动收集 .shp（跳过 *_origin / *_smooth）。
+        cache_size (int): 同时驻留内存的景索引数。
+    """
+
+    def __init__(self, shapefiles, cache_size=8):
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self.scenes, self._bounds = {}, {}
+        for shp in _collect_shapefiles(shapefiles):
+            index_path = self._ensure_index(shp)
+            # npz 按成员惰性读取，这里只读取景范围
+            with np.load(index_path) as data:
+                bounds = data['bounds']
+            self.scenes[shp.stem] = index_path
+            self._bounds[shp.stem] = bounds
+
+    @staticmethod
+    def _ensure_index(shp_path):
+        """索引不存在或与 shapefile 不一致时重建。"""
+        index_path = index_path_for(shp_path)
+        if index_path.exists():
+            with np.load(index_path) as data:
+                if np.array_equal(data['source'], _source_fingerprint(shp_path)):
+                    return index_path
+        return build_scene_index(shp_path, index_path)
+
+    def get(self, scene) -> SceneIndex:
+        index = self._cache.get(scene)
+        if index is not None:
+            self._cache.move_to_end(scene)
+            return index
+        index = SceneIndex(self.scenes[scene], scene)
+        self._cache[scene] = index
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return index
+
+    def _scenes_for(self, qboxes):
+        """返回 {景名: 与该景范围相交的查询下标}。"""
+        routed = {}
+        for scene, b in self._bounds.items():
+            if np.isnan(b).any():
+                continue
+            hit = np.nonzero((qboxes[:, 0] <= b[2]) & (qboxes[:, 2] >= b[0]) &
+                             (qboxes[:, 1] <= b[3]) & (qboxes[:, 3] >= b[1]))[0]
+            if len(hit):
+                routed[scene] = hit
+        return routed
+
+    def query_points(self, points):
+        """批量点查询，返回每个点所在地块的列表。"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        results = [[] for _ in range(len(points))]
+        for scene, hit in self._scenes_for(np.hstack([points, points])).items():
+            for qi, found in zip(hit, self.get(scene).query_points(points[hit])):
+                results[qi].extend(found)
+        return results
+
+    def query_bboxes(self, bboxes, exact=True):
+        """批量范围查询，返回每个 bbox 内（相交）的地块列表。"""
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape(-1, 4)
+        results = [[] for _ in range(len(bboxes))]
+        for scene, hit in self._scenes_for(bboxes).items():
+            for qi, found in zip(hit, self.get(scene).query_bboxes(bboxes[hit], exact=exact)):
+                results[qi].extend(found)
+        return results
+
+    def nearest(self, points, k=1):
+        """批量最近邻查询，返回每个点最近的 k 个地块（附 'distance'）。"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        results = []
+        valid = [(s, b) for s, b in self._bounds.items() if not np.isnan(b).any()]
+        for x, y in points:
+            # 按景范围距离由近到远搜索，景范围距离超过当前第 k 近距离后停止
+            scene_dist = sorted((float(_box_distance(b[None, :], x, y)[0]), s) for s, b in valid)
+            best = []
+            for d, scene in scene_dist:
+                if len(best) == k and d > best[-1][0]:
+                    break
+                limit = best[-1][0] if len(best) == k else np.inf
+                index = self.get(scene)
+                for dist, i in index.nearest(x, y, k=k, max_distance=limit):
+                    best.append((dist, index.result(i)))
+                best = sorted(best, key=lambda item: item[0])[:k]
+            results.append([dict(r, distance=d) for d, r in best])
+        return results
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Parcel Index Build and Query')
+    parser.add_argument('--build', type=str, nargs='+', default=None, help='为目录或 shapefile 建立/更新索引')
+    parser.add_argument('--scenes', type=str, nargs='+', default=None, help='查询的成果目录或 shapefile')
+    parser.add_argument('--point', type=float, nargs=2, action='append', default=[], help='点查询 x y（可多次）')
+    parser.add_argument('--bbox', type=float, nargs=4, action='append', default=[], help='范围查询 minx miny maxx maxy（可多次）')
+    parser.add_argument('--nearest', type=float, nargs=2, action='append', default=[], help='最近邻查询 x y（可多次）')
+    parser.add_argument('--k', type=int, default=1, help='最近邻个数')
+    args = parser.parse_args()
+
+    if args.build:
+        store = ParcelIndexStore(args.build)
+        print(f"索引就绪：{len(store.scenes)} 景")
+
+    if args.scenes:
+        store = ParcelIndexStore(args.scenes)
+        if args.point:
+            print(json.dumps(store.query_points(args.point), ensure_ascii=False, indent=2))
+        if args.bbox:
+            print(json.dumps(store.query_bboxes(args.bbox), ensure_ascii=False, indent=2))
+        if args.nearest:
+            print(json.dumps(store.nearest(args.nearest, k=args.k), ensure_ascii=False, indent=2))
@@ -4,6 +4,7 @@ import os
 from osgeo import ogr, osr
 import math
 import os
+import numpy as np
 
 def smooth_polygon_by_window(geom, window_size=5, strength=0.3, corner_angle_threshold=160):
     """
@@ -96,6 +97,115 @@ def smooth_polygon_by_window(geom, window_size=5, strength=0.3, corner_angle_thr
 
 
 
+def count_vertices(geom):
+    """统计几何（含多边形的所有环、多多边形的所有部分）的顶点数。"""
+    if geom is None or geom.IsEmpty():
+        return 0
+    if geom.GetGeometryCount() > 0:
+        return sum(count_vertices(geom.GetGeometryRef(i)) for i in range(geom.GetGeometryCount()))
+    return geom.GetPointCount()
+
+
+def _exterior_coords(geom):
+    ring = geom.GetGeometryRef(0)
+    return np.array(ring.GetPoints(), dtype=np.float64)[:, :2]
+
+
+def _directed_hausdorff(points, ring, max_elements=2_000_000):
+    """
+    点集到闭合折线的最大最近距离（点到线段，分块向量化）。
+
+    按 点数 × 线段数 分块，每块的临时数组不超过 max_elements 个元素（float64 约 16MB），
+    大地块的像素锯齿外环（上万个顶点）也不会占用过多内存。
+    """
+    ax, ay = ring[:-1, 0], ring[:-1, 1]
+    abx, aby = ring[1:, 0] - ax, ring[1:, 1] - ay
+    ab_len2 = np.maximum(abx * abx + aby * aby, 1e-24)
+    chunk = max(1, max_elements // max(len(ax), 1))
+    result = 0.0
+    for start in range(0, len(points), chunk):
+        px = points[start:start + chunk, 0, None] - ax
+        py = points[start:start + chunk, 1, None] - ay
+        t = np.clip((px * abx + py * aby) / ab_len2, 0.0, 1.0)
+        px -= t * abx
+        py -= t * aby
+        d2 = px * px + py * py
+        result = max(result, float(np.sqrt(d2.min(axis=1)).max()))
+    return result
+
+
+def hausdorff_distance(geom_a, geom_b):
+    """两个多边形外环之间的（基于顶点的）Hausdorff 距离。"""
+    ca, cb = _exterior_coords(geom_a), _exterior_coords(geom_b)
+    return max(_directed_hausdorff(ca, cb), _directed_hausdorff(cb, ca))
+
+
+def adaptive_simplify_and_smooth(geom, base_tolerance, vertex_budget, max_hausdorff, smooth_fn, iterations=12,
+                                 vertices_per_unit=None):
+    """
+    按顶点预算自适应选择单个地块的 DP 简化容差。
+
+    在 [base_tolerance, max_hausdorff] 上二分查找满足“平滑后顶点数 <= vertex_budget 且与原始边界
+    Hausdorff 距离 <= max_hausdorff”的最小容差；未给定 max_hausdorff 时通过倍增确定上界。
+    无法同时满足时返回满足偏差约束的、顶点最少的结果，都不满足时返回 base_tolerance 的结果。
+
+    Args:
+        geom: ogr.Geometry，投影坐标系下的原始多边形。
+        base_tolerance (float): 基础简化容差（下界）。
+        vertex_budget (int): 顶点数上限。
+        max_hausdorff (float): 允许的最大边界偏差，可为 None。
+        smooth_fn: 对简化结果做平滑的函数。
+        iterations (int): 二分次数。
+        vertices_per_unit (float): 每单位周长的顶点数，可选。周长取基础容差简化并平滑后的结果，
+            而非原始像素锯齿外环（斜边处锯齿外环最长约为真实边界的 √2 倍）；预算取两者较小值，至少为 4。
+
+    Returns:
+        ogr.Geometry 或 None（简化结果为空时）。
+    """
+    def run(tolerance):
+        simplified = geom.Simplify(tolerance)
+        if simplified is None or simplified.IsEmpty():
+            return None
+        return smooth_fn(simplified)
+
+    base = run(base_tolerance)
+    if base is not None and vertices_per_unit is not None:
+        vertex_budget = min(vertex_budget, max(4, math.ceil(vertices_per_unit * base.Boundary().Length())))
+    if base is None or count_vertices(base) <= vertex_budget:
+        return base
+    if geom.GetGeometryType() != ogr.wkbPolygon:
+        return base
+
+    def acceptable_deviation(candidate):
+        return max_hausdorff is None or hausdorff_distance(geom, candidate) <= max_hausdorff
+
+    lo = base_tolerance
+    if max_hausdorff is not None:
+        hi = max(max_hausdorff, base_tolerance)
+    else:
+        hi = max(base_tolerance, 1e-9) * 2
+        for _ in range(20):
+            candidate = run(hi)
+            if candidate is None or count_vertices(candidate) <= vertex_budget:
+                break
+            hi *= 2
+
+    best, fallback = None, base
+    for _ in range(iterations):
+        mid = (lo + hi) / 2
+        candidate = run(mid)
+        if candidate is None or not acceptable_deviation(candidate):
+            hi = mid
+            continue
+        if count_vertices(candidate) < count_vertices(fallback):
+            fallback = candidate
+        if count_vertices(candidate) <= vertex_budget:
+            best, hi = candidate, mid
+        else:
+            lo = mid
+    return best if best is not None else fallback
+
+
 def simplify_and_smooth_parcels(
     input_shp: str, 
     output_shp: str, 
@@ -103,11 +213,18 @@ def simplify_and_smooth_parcels(
     simplify_tolerance: float,
     smooth_window_size: int = 5,
     smooth_strength: float = 0.5,
-    corner_angle_threshold: float = 160
+    corner_angle_threshold: float = 160,
+    max_vertices: int = None,
+    vertices_per_unit: float = None,
+    max_hausdorff: float = None
 ):
     """
     【最终版】通过“先简化，再平滑”的两阶段流程，完美处理锯齿问题。
     流程: WGS84 -> UTM -> Simplify(DP) -> Smooth(Window) -> WGS84
+
+    自适应模式：给定 max_vertices 和/或 vertices_per_unit（每米周长的顶点数，周长按基础容差简化平滑后的边界计）时，每个地块的顶点预算取两者较小值，
+    超出预算的地块用 adaptive_simplify_and_smooth 逐个二分选择 DP 容差，偏差不超过 max_hausdorff（米）。
+    结束时输出总顶点数的变化。
     """
     driver = ogr.GetDriverByName("ESRI Shapefile")
     if os.path.exists(output_shp):
@@ -132,7 +249,12 @@ def simplify_and_smooth_parcels(
     out_lyr = out_ds.CreateLayer("final_smooth", source_srs, in_lyr.GetGeomType())
     out_lyr.CreateFields(in_lyr.schema)
 
-    print(f"开始对 {feature_count} 个地块进行两阶段处理 (简化+平滑)...")
+    adaptive = max_vertices is not None or vertices_per_unit is not None
+    def smooth_fn(g):
+        return smooth_polygon_by_window(g, smooth_window_size, smooth_strength, corner_angle_threshold)
+    vertices_in, vertices_out = 0, 0
+
+    print(f"开始对 {feature_count} 个地块进行两阶段处理 (简化+平滑{'，自适应顶点预算' if adaptive else ''})...")
     
     in_lyr.ResetReading()
     for i, feat in enumerate(in_lyr):
@@ -144,18 +266,25 @@ def simplify_and_smooth_parcels(
         geom_utm = geom_wgs84.Clone()
         geom_utm.Transform(wgs84_to_utm)
         
-        # 2. 【第一阶段】在UTM下进行DP简化，消除高频锯齿
-        simplified_utm_geom = geom_utm.Simplify(simplify_tolerance)
-        
-        if simplified_utm_geom is None or simplified_utm_geom.IsEmpty(): continue
-        
-        # 3. 【第二阶段】对简化后的结果进行滑动窗口平滑，美化外观
-        final_utm_geom = smooth_polygon_by_window(
-            simplified_utm_geom, 
-            smooth_window_size, 
-            smooth_strength,
-            corner_angle_threshold
-        )
+        vertices_in += count_vertices(geom_utm)
+
+        if adaptive:
+            # 2-3. 自适应模式：按顶点预算逐地块选择简化容差，再平滑
+            budget = max(4, max_vertices) if max_vertices is not None else math.inf
+            final_utm_geom = adaptive_simplify_and_smooth(
+                geom_utm, simplify_tolerance, budget, max_hausdorff, smooth_fn,
+                vertices_per_unit=vertices_per_unit
+            )
+            if final_utm_geom is None: continue
+        else:
+            # 2. 【第一阶段】在UTM下进行DP简化，消除高频锯齿
+            simplified_utm_geom = geom_utm.Simplify(simplify_tolerance)
+
+            if simplified_utm_geom is None or simplified_utm_geom.IsEmpty(): continue
+
+            # 3. 【第二阶段】对简化后的结果进行滑动窗口平滑，美化外观
+            final_utm_geom = smooth_fn(simplified_utm_geom)
+        vertices_out += count_vertices(final_utm_geom)
         
         # 4. 投影回WGS84
         final_wgs84_geom = final_utm_geom
@@ -174,8 +303,13 @@ def simplify_and_smooth_parcels(
             print(f"  ...已处理 {i + 1} / {feature_count}")
 
     in_ds, out_ds = None, None
+    if vertices_in > 0:
+        print(f"顶点数：{vertices_in} → {vertices_out}（减少 {100.0 * (vertices_in - vertices_out) / vertices_in:.1f}%）")
     print(f"✅ 两阶段处理完成 → {output_shp}")
-if __name__ == '__main__':
+
+
+def cli_main(argv=None):
+    """按命令行参数运行简化与平滑。"""
     import argparse
     parser = argparse.ArgumentParser(description='Parcel Simplify and Smooth Script')
     parser.add_argument('--input_shp', type=str, required=True, help='输入地块矢量文件（Shapefile）')
@@ -185,7 +319,10 @@ if __name__ == '__main__':
     parser.add_argument('--smooth_window_size', type=int, default=3, help='平滑窗口大小（奇数>=3）')
     parser.add_argument('--smooth_strength', type=float, default=0.5, help='平滑强度(0~1)')
     parser.add_argument('--corner_angle_threshold', type=float, default=160.0, help='角点保护阈值（度）')
-    args = parser.parse_args()
+    parser.add_argument('--max_vertices', type=int, default=None, help='自适应模式：每个地块的最大顶点数')
+    parser.add_argument('--vertices_per_unit', type=float, default=None, help='自适应模式：每米周长的最大顶点数（周长按基础容差简化平滑后的边界计）')
+    parser.add_argument('--max_hausdorff', type=float, default=None, help='自适应模式：与原始边界的最大 Hausdorff 偏差（米）')
+    args = parser.parse_args(argv)
     simplify_and_smooth_parcels(
         input_shp=args.input_shp,
         output_shp=args.output_shp,
@@ -193,9 +330,12 @@ if __name__ == '__main__':
         simplify_tolerance=args.simplify_tolerance,  # 2米容差，用于消除像素级锯齿，根据分辨率调整，容差越大越平滑
         smooth_window_size=args.smooth_window_size,    # 3点窗口平滑,窗口越大平滑效果越明显但也会导致边界偏移丢失细节
         smooth_strength=args.smooth_strength,      # 0.5强度平滑
-        corner_angle_threshold=args.corner_angle_threshold # 角点保护阈值，单位：度
+        corner_angle_threshold=args.corner_angle_threshold, # 角点保护阈值，单位：度
+        max_vertices=args.max_vertices,
+        vertices_per_unit=args.vertices_per_unit,
+        max_hausdorff=args.max_hausdorff
     )
 
 
-
-
+if __name__ == '__main__':
+    cli_main()
@@ -1,3 +1,5 @@
+import os
+import json
 import numpy as np
 from osgeo import gdal, ogr, osr
 import cv2
@@ -6,6 +8,7 @@ from skimage.filters import meijering
 from scipy.signal import convolve2d
 from scipy.ndimage import distance_transform_edt
 from scipy.ndimage import label
+from fusion import fuse_edge_maps, same_grid, FUSION_METHODS
 
 def add_thick_border_frame(skeleton_map: np.ndarray, width: int = 2) -> np.ndarray:
     """
@@ -157,7 +160,105 @@ def reconstruct_variable_width_from_skeleton(
     final_mask = (dists <= reconstructed_radii).astype(np.uint8)
 
     return final_mask
-def line2shp(raster_filename, shapefile_filename, pred_band=1):
+# 地块属性字段：(字段名, OGR 类型)。shapefile 字段名最长 10 个字符
+PARCEL_STAT_FIELDS = [
+    ('area_px', ogr.OFTInteger),
+    ('perim_px', ogr.OFTInteger),
+    ('compact', ogr.OFTReal),
+    ('edge_prob', ogr.OFTReal),
+    ('crop_frac', ogr.OFTReal),
+]
+
+
+def compute_parcel_stats(labels: np.ndarray, edge_image: np.ndarray, mask: np.ndarray = None, mask_nodata=None) -> dict:
+    """
+    在标签栅格上一次向量化遍历（np.bincount）计算所有地块的属性。
+
+    Args:
+        labels (np.ndarray): 地块标签图，0 为背景（边界）。
+        edge_image (np.ndarray): 与 labels 同尺寸的原始边缘概率图（边界为暗值）。
+        mask (np.ndarray): 与 labels 同尺寸的耕地掩膜（1 为耕地），可选。
+        mask_nodata: 掩膜的 NoData 值，可选。
+
+    Returns:
+        dict: 字段名 -> 以标签值为下标的数组。
+            area_px 面积（像素数）；perim_px 周长（像素边数，4 邻域）；
+            compact 紧凑度 4πA/P²；edge_prob 平均边界概率 (0~1)；
+            crop_frac 耕地占比（仅在提供 mask 时存在）。
+    """
+    flat = labels.ravel()
+    n = int(flat.max()) + 1
+    area = np.bincount(flat, minlength=n)
+
+    # 周长：统计每个标签与相邻不同值像素之间的边数，外围补 0 以计入图像边缘
+    padded = np.pad(labels, 1, mode='constant', constant_values=0)
+    perimeter = np.zeros(n, dtype=np.int64)
+    for a, b in ((padded[:, :-1], padded[:, 1:]), (padded[:-1, :], padded[1:, :])):
+        diff = a != b
+        perimeter += np.bincount(a[diff], minlength=n)
+        perimeter += np.bincount(b[diff], minlength=n)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        compactness = np.where(perimeter > 0, 4 * np.pi * area / perimeter.astype(np.float64) ** 2, 0.0)
+        # 输入图边界为暗值，故边界概率为 (255 - v) / 255
+        edge_sum = np.bincount(flat, weights=(255.0 - edge_image.ravel()) / 255.0, minlength=n)
+        edge_prob = np.where(area > 0, edge_sum / area, 0.0)
+
+    stats = {
+        'area_px': area,
+        'perim_px': perimeter,
+        'compact': compactness,
+        'edge_prob': edge_prob,
+    }
+
+    if mask is not None:
+        valid = np.ones(flat.shape, dtype=bool) if mask_nodata is None else mask.ravel() != mask_nodata
+        total = np.bincount(flat[valid], minlength=n)
+        overlap = np.bincount(flat[valid & (mask.ravel() == 1)], minlength=n)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            stats['crop_frac'] = np.where(total > 0, overlap / total, 0.0)
+
+    return stats
+
+
+def read_mask_on_grid(mask_tif, ref_ds):
+    """
+    读取耕地掩膜并对齐到参考数据集（边缘概率图）的网格。
+
+    网格一致时直接读取；否则按参考影像的范围、尺寸和坐标系以最近邻重采样 warp 到内存
+    （与 filter_by_cropland._align_mask_to_parcels 相同，掩膜本身没有 NoData 时范围外的像素以 255 标记）。
+
+    Returns:
+        (mask_array, mask_nodata)；掩膜无法打开或无法对齐（参考影像非北向朝上、只有一方带坐标系）时返回 (None, None)。
+    """
+    mask_ds = gdal.Open(str(mask_tif))
+    if mask_ds is None:
+        return None, None
+    band = mask_ds.GetRasterBand(1)
+    nodata = band.GetNoDataValue()
+    if same_grid(mask_ds, ref_ds):
+        return band.ReadAsArray(), nodata
+
+    ref_gt = ref_ds.GetGeoTransform()
+    ref_wkt = ref_ds.GetProjection()
+    north_up = ref_gt[2] == 0 and ref_gt[4] == 0 and ref_gt[1] > 0 and ref_gt[5] < 0
+    if not north_up or bool(ref_wkt) != bool(mask_ds.GetProjection()):
+        return None, None
+    cols, rows = ref_ds.RasterXSize, ref_ds.RasterYSize
+    bounds = (ref_gt[0], ref_gt[3] + rows * ref_gt[5], ref_gt[0] + cols * ref_gt[1], ref_gt[3])
+    nodata = 255 if nodata is None else nodata
+    warp_kwargs = dict(format='MEM', outputBounds=bounds, width=cols, height=rows,
+                       resampleAlg='near', dstNodata=nodata)
+    if ref_wkt:
+        warp_kwargs['dstSRS'] = ref_wkt
+    print(f"耕地掩膜与输入栅格网格不一致，warp 到输入网格: {mask_tif}")
+    warped = gdal.Warp('', mask_ds, **warp_kwargs)
+    if warped is None:
+        return None, None
+    return warped.GetRasterBand(1).ReadAsArray(), nodata
+
+
+def line2shp(raster_filename, shapefile_filename, pred_band=1, parcel_stats=None):
     raster_dataset = gdal.Open(raster_filename)
     if raster_dataset is None:
         print('[FATAL] GDAL open file failed. [%s]' % raster_filename)
@@ -179,13 +280,116 @@ def line2shp(raster_filename, shapefile_filename, pred_band=1):
     layer = shape_dataset.CreateLayer('pred', proj_shp, ogr.wkbPolygon)
     field_name = ogr.FieldDefn('objects', ogr.OFTInteger)
     layer.CreateField(field_name)
+    stat_fields = []
+    if parcel_stats is not None:
+        stat_fields = [(name, field_type) for name, field_type in PARCEL_STAT_FIELDS if name in parcel_stats]
+        for name, field_type in stat_fields:
+            field_defn = ogr.FieldDefn(name, field_type)
+            if field_type == ogr.OFTReal:
+                field_defn.SetWidth(12)
+                field_defn.SetPrecision(6)
+            layer.CreateField(field_defn)
     band = raster_dataset.GetRasterBand(pred_band)
     gdal.Polygonize(band, band, layer, 0)
+
+    # 按标签值回填地块属性
+    if stat_fields:
+        layer.ResetReading()
+        for feat in layer:
+            value = feat.GetField('objects')
+            for name, field_type in stat_fields:
+                v = parcel_stats[name][value]
+                feat.SetField(name, int(v) if field_type == ogr.OFTInteger else float(v))
+            layer.SetFeature(feat)
     del shape_dataset
 
-def main(in_raster, shapefile_filename):
-    # 1. 读取边界强度图，并计算内部区域掩码
-    image = gdal.Open(in_raster).ReadAsArray()
+def _checkpoint_params(in_rasters, **extra):
+    """生成检查点参数：输入文件指纹 + 各步骤的关键参数，任一变化都会使检查点失效。"""
+    sources = []
+    for path in in_rasters:
+        st = os.stat(path)
+        sources.append({
+            'in_raster': os.path.abspath(path),
+            'size': st.st_size,
+            'mtime': st.st_mtime,
+        })
+    params = {'sources': sources}
+    params.update(extra)
+    return params
+
+
+def save_checkpoint(checkpoint_dir, name, array, params):
+    """
+    将中间结果保存为 .npy 检查点，并以内存映射方式重新打开。
+
+    先删除旧的参数文件，再写数组，最后写参数文件，保证中途失败时不会留下“参数与数组不匹配”的检查点。
+
+    Args:
+        checkpoint_dir (str): 检查点目录（每景影像一个目录）。
+        name (str): 检查点名称，如 'ridge_mask'。
+        array (np.ndarray): 要保存的数组。
+        params (dict): 生成该数组所用的参数。
+
+    Returns:
+        以只读内存映射方式打开的数组，后续步骤无需将其完整载入内存。
+    """
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    npy_path = os.path.join(checkpoint_dir, name + '.npy')
+    meta_path = os.path.join(checkpoint_dir, name + '.json')
+    if os.path.exists(meta_path):
+        os.remove(meta_path)
+
+    tmp_npy = os.path.join(checkpoint_dir, name + '.tmp.npy')
+    np.save(tmp_npy, np.ascontiguousarray(array))
+    os.replace(tmp_npy, npy_path)
+
+    meta = {'params': params, 'shape': list(array.shape), 'dtype': str(array.dtype)}
+    tmp_meta = meta_path + '.tmp'
+    with open(tmp_meta, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_meta, meta_path)
+
+    return np.load(npy_path, mmap_mode='r')
+
+
+def load_checkpoint(checkpoint_dir, name, params):
+    """
+    读取检查点，参数不一致或文件损坏时返回 None。
+
+    Returns:
+        以只读内存映射方式打开的数组，或 None。
+    """
+    if not checkpoint_dir:
+        return None
+    npy_path = os.path.join(checkpoint_dir, name + '.npy')
+    meta_path = os.path.join(checkpoint_dir, name + '.json')
+    if not (os.path.exists(npy_path) and os.path.exists(meta_path)):
+        return None
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('params') != params:
+            return None
+        array = np.load(npy_path, mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    if list(array.shape) != meta.get('shape') or str(array.dtype) != meta.get('dtype'):
+        return None
+    print(f"[checkpoint] 复用检查点 {npy_path}")
+    return array
+
+
+def extract_ridge_mask(image: np.ndarray, pad: int = 1) -> np.ndarray:
+    """
+    从边缘概率图提取脊线二值图（距离变换 + Meijering + Otsu），并在四周补 pad 像素宽的边界。
+
+    Args:
+        image (np.ndarray): 原始边缘概率图。
+        pad (int): 四周补边宽度，防止边缘效应。
+
+    Returns:
+        补边后的脊线二值图 (uint8)。
+    """
     edge_intensity_map = 255 - image # 输入的是“反转”的边缘图，即边界为暗(值低)，地块为亮(值高)
 
     # 获取内部区域掩码（边界强度低于50的区域为内部）
@@ -194,57 +398,212 @@ def main(in_raster, shapefile_filename):
     dst2 = morphology.closing(dst1)
     # 获取距离变换图，目的是为了后续重建可变宽度边界
     distance_map = distance_transform_edt(1 - dst2)
-    # 2. 提取脊线，并用otsu法二值化（参考arcgis的思想）
+    # 提取脊线，并用otsu法二值化（参考arcgis的思想）
     ridgeness_map = meijering(distance_map, sigmas=(1,2), black_ridges=False)
     ridgeness_map_8bit = cv2.normalize(ridgeness_map, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
-    
+
     ridge_threshold_otsu, ridge_mask = cv2.threshold(
         ridgeness_map_8bit, 0, 1, cv2.THRESH_BINARY + cv2.THRESH_OTSU
     )
     skeleton_img = ridge_mask.astype(np.uint8)
 
     # 在骨架图四周增加1像素宽的边界，防止边缘效应
+    return np.pad(skeleton_img, pad_width=pad, mode='constant', constant_values=1)
+
+
+def prune_skeleton(skeleton_img: np.ndarray) -> np.ndarray:
+    """仅保留最大连通域，骨架化后剪除悬挂线。"""
+    instance_map_holey, num_instances = label(skeleton_img, structure=np.array([[0,1,0],[1,1,1],[0,1,0]]))
+    instace_map = np.where(instance_map_holey==1,1,0) # 仅保留最大连通域
+    skeleton = morphology.skeletonize(instace_map > 0)
+    pruned = skeleton.astype(np.uint8)
+    # 进行剪枝，去除悬挂线（核心在于交叉点的定义）
+    return prune_dangling_lines_fast(pruned)
+
+
+# 标签栅格输出的压缩方式
+RASTER_COMPRESS_CHOICES = ['DEFLATE', 'ZSTD', 'LZW', 'NONE']
+
+
+def _smallest_label_dtype(max_value: int):
+    """返回能容纳 max_value 的最小无符号 GDAL 数据类型。"""
+    if max_value <= np.iinfo(np.uint8).max:
+        return gdal.GDT_Byte
+    if max_value <= np.iinfo(np.uint16).max:
+        return gdal.GDT_UInt16
+    return gdal.GDT_UInt32
+
+
+def write_label_raster(output_raster, array, gt, projection, compress='DEFLATE', blocksize=512, cog=False, num_threads='ALL_CPUS'):
+    """
+    将标签图写为分块、压缩的 GeoTIFF（可选 COG 布局），数据类型取能容纳最大标签值的最小类型。
+
+    Args:
+        output_raster (str): 输出路径。
+        array (np.ndarray): 标签图。
+        gt (list): GeoTransform。
+        projection (str): 投影 WKT。
+        compress (str): 压缩方式，见 RASTER_COMPRESS_CHOICES。
+        blocksize (int): 分块大小（像素）。
+        cog (bool): 是否输出 Cloud Optimized GeoTIFF（含金字塔，需 GDAL >= 3.1）。
+        num_threads (str): 压缩线程数，'ALL_CPUS' 表示使用全部核心。
+    """
+    rows, cols = array.shape
+    data_type = _smallest_label_dtype(int(array.max()) if array.size else 0)
+
+    options = [f'COMPRESS={compress}', f'NUM_THREADS={num_threads}', 'BIGTIFF=IF_SAFER']
+    if compress != 'NONE':
+        options.append('PREDICTOR=2') # 整型水平差分预测，对大片相同值的标签图压缩效果显著
+
+    if cog:
+        # COG 驱动只支持 CreateCopy，先写入内存数据集再转换
+        mem_ds = gdal.GetDriverByName('MEM').Create('', cols, rows, 1, data_type)
+        mem_ds.SetGeoTransform(gt)
+        mem_ds.SetProjection(projection)
+        mem_ds.GetRasterBand(1).WriteArray(array)
+        options += [f'BLOCKSIZE={blocksize}', 'OVERVIEWS=AUTO', 'RESAMPLING=NEAREST']
+        out_raster = gdal.Translate(output_raster, mem_ds, format='COG', creationOptions=options)
+        if out_raster is None:
+            print('[FATAL] GDAL create COG failed. [%s]' % output_raster)
+            exit(1)
+        out_raster = None
+        mem_ds = None
+        return
+
+    options += ['TILED=YES', f'BLOCKXSIZE={blocksize}', f'BLOCKYSIZE={blocksize}']
+    driver = gdal.GetDriverByName('GTiff')
+    out_raster = driver.Create(output_raster, cols, rows, 1, data_type, options=options)
+    if out_raster is None:
+        print('[FATAL] GDAL create file failed. [%s]' % output_raster)
+        exit(1)
+    out_raster.SetGeoTransform(gt)
+    out_raster.SetProjection(projection)
+    out_raster.GetRasterBand(1).WriteArray(array)
+    out_raster.FlushCache()
+    out_raster = None
+
+
+def main(in_raster, shapefile_filename, checkpoint_dir=None, mask_tif=None, compress='DEFLATE', blocksize=512, cog=False,
+         crop_threshold=None, fusion='mean', edge_image=None, mask_array=None, mask_nodata=None):
+    """
+    thinning 主流程。
+
+    in_raster 可为单个边缘概率图，也可为多个边缘概率图的列表或多波段堆栈；后两种情况先按 fusion
+    （mean / median / max）逐块融合为一景，再进入后续处理，输出网格与第一个输入一致。
+
+    输出图层除 objects 外还带有每个地块的面积、周长、紧凑度和平均边界概率；
+    提供耕地掩膜 mask_tif 时另外写入耕地占比 crop_frac；掩膜网格（尺寸、地理变换、坐标系）与输入不一致时
+    先 warp 到输入网格（见 read_mask_on_grid），无法对齐时跳过 crop_frac。
+
+    标签栅格按 compress / blocksize / cog 写为分块压缩的 GeoTIFF，见 write_label_raster。
+
+    crop_threshold 不为空时启用融合过滤：在矢量化之前直接在标签栅格上剔除耕地占比低于阈值的地块，
+    后续 Polygonize 与平滑只处理保留下来的地块（与 filter_by_cropland 的判定一致）。掩膜无法对齐到输入网格时以 [FATAL] 退出。
+
+    checkpoint_dir 不为空时，脊线掩码、剪枝骨架和重建边界会以 .npy 检查点形式保存（每景影像应使用独立目录），
+    重跑时从最后一个有效检查点继续；输入文件或参数变化后检查点自动失效。
+
+    edge_image / mask_array（及 mask_nodata）为预先读入内存的（已融合的）边缘概率图和已对齐到输入网格的耕地掩膜，
+    给定时不再从 in_raster / mask_tif 读取像素，供 main.py 的流水线模式预取使用。
+    """
     pad = 1
-    skeleton_img = np.pad(skeleton_img, pad_width=pad, mode='constant', constant_values=1)
     # 获取原始GeoTransform并调整
-    src = gdal.Open(in_raster)
+    sources = [in_raster] if isinstance(in_raster, (str, os.PathLike)) else list(in_raster)
+    src = gdal.Open(str(sources[0]))
     gt = list(src.GetGeoTransform())
     pixel_w, pixel_h = gt[1], gt[5]
     gt[0] = gt[0] - pixel_w * pad        # 左移地理起点X
     gt[3] = gt[3] - pixel_h * pad        # 上移地理起点Y
-    # skeleton_img = add_thick_border_frame(ridge_top_mask, width=1)
 
-    # 3. 优化骨架，去除悬挂线和碎片
-    instance_map_holey, num_instances = label(skeleton_img, structure=np.array([[0,1,0],[1,1,1],[0,1,0]]))
-    instace_map = np.where(instance_map_holey==1,1,0) # 仅保留最大连通域
-    skeleton = morphology.skeletonize(instace_map > 0)
-    pruned = skeleton.copy().astype(np.uint8)
-    # 进行剪枝，去除悬挂线（核心在于交叉点的定义）
-    pruned = prune_dangling_lines_fast(pruned)
-    # 重建可变宽度边界
-    puned_last = reconstruct_variable_width_from_skeleton(pruned, skeleton_img)
+    params = _checkpoint_params(sources, fusion=fusion, pad=pad, interior_threshold=50, sigmas=[1, 2]) if checkpoint_dir else None
+
+    def read_edge_image():
+        # 多个输入或多波段堆栈时先做集成融合
+        if len(sources) > 1 or src.RasterCount > 1:
+            return fuse_edge_maps(sources, method=fusion)
+        return src.ReadAsArray()
+
+    # 1-3. 倒序查找最后一个有效检查点，只重算其后的步骤
+    puned_last = load_checkpoint(checkpoint_dir, 'boundary_mask', params)
+    if puned_last is None:
+        # 1-2. 读取边界强度图，提取脊线
+        skeleton_img = load_checkpoint(checkpoint_dir, 'ridge_mask', params)
+        if skeleton_img is None:
+            if edge_image is None:
+                edge_image = read_edge_image()
+            skeleton_img = extract_ridge_mask(edge_image, pad=pad)
+            if checkpoint_dir:
+                skeleton_img = save_checkpoint(checkpoint_dir, 'ridge_mask', skeleton_img, params)
+        # skeleton_img = add_thick_border_frame(ridge_top_mask, width=1)
+
+        # 3. 优化骨架，去除悬挂线和碎片
+        pruned = load_checkpoint(checkpoint_dir, 'pruned_skeleton', params)
+        if pruned is None:
+            pruned = prune_skeleton(skeleton_img)
+            if checkpoint_dir:
+                pruned = save_checkpoint(checkpoint_dir, 'pruned_skeleton', pruned, params)
+        # 重建可变宽度边界
+        puned_last = reconstruct_variable_width_from_skeleton(pruned, skeleton_img)
+        if checkpoint_dir:
+            puned_last = save_checkpoint(checkpoint_dir, 'boundary_mask', puned_last, params)
+        del skeleton_img, pruned
+
     labels = morphology.label(puned_last,1, connectivity=1)
     result = morphology.remove_small_objects(labels, 100)
 
+    # 地块属性：与补边后的标签图对齐，补边区域均为边界（标签 0），填充值不影响结果
+    if edge_image is None:
+        edge_image = read_edge_image()
+    edge_image = np.pad(edge_image, pad_width=pad, mode='edge')
+    mask = None
+    if mask_array is None and mask_tif:
+        # 掩膜网格与输入不一致时 warp 到输入网格
+        mask_array, mask_nodata = read_mask_on_grid(mask_tif, src)
+    if mask_array is not None and mask_array.shape == (src.RasterYSize, src.RasterXSize):
+        mask = np.pad(mask_array, pad_width=pad, mode='constant', constant_values=0)
+    elif mask_tif or mask_array is not None:
+        if crop_threshold is not None:
+            print('[FATAL] Fused cropland filter cannot align the mask to the input grid. [%s]' % mask_tif)
+            exit(1)
+        print(f'[WARN] 耕地掩膜无法对齐到输入栅格网格，跳过 crop_frac: {mask_tif}')
+    elif crop_threshold is not None:
+        print('[FATAL] Fused cropland filter needs --mask_tif.')
+        exit(1)
+    parcel_stats = compute_parcel_stats(result, edge_image, mask, mask_nodata)
+    del edge_image, mask, mask_array
+
+    # 融合过滤：按标签查表一次性剔除耕地占比不足的地块
+    if crop_threshold is not None:
+        keep = parcel_stats['crop_frac'] >= crop_threshold
+        keep[0] = False
+        print(f"融合过滤：保留 {int(np.count_nonzero(keep))} / {int(np.count_nonzero(parcel_stats['area_px'][1:]))} 个地块")
+        result = np.where(keep[result], result, 0)
 
     # 4. 保存结果为栅格和矢量
     output_raster = shapefile_filename.replace('.shp', '.tif')
-    driver = gdal.GetDriverByName('GTiff')  
-    out_raster = driver.Create(output_raster, skeleton_img.shape[1], skeleton_img.shape[0], 1, gdal.GDT_UInt32)
-    out_raster.SetGeoTransform(gt)
-    out_raster.SetProjection(src.GetProjection())
-    out_raster.GetRasterBand(1).WriteArray(result)
-    out_raster.FlushCache()
-    out_raster = None
-    line2shp(output_raster, shapefile_filename, pred_band=1)
+    write_label_raster(output_raster, result, gt, src.GetProjection(), compress=compress, blocksize=blocksize, cog=cog)
+    line2shp(output_raster, shapefile_filename, pred_band=1, parcel_stats=parcel_stats)
 
 
-if __name__ == '__main__':
+def cli_main(argv=None, **overrides):
+    """按命令行参数运行 thinning；overrides 直接传给 main（如预读的 edge_image / mask_array）。"""
     import argparse
     parser = argparse.ArgumentParser(description='Parcel Thinning Script')
-    parser.add_argument('--in_raster', type=str, required=True, help='输入边缘概率图（GeoTIFF）')
+    parser.add_argument('--in_raster', type=str, nargs='+', required=True, help='输入边缘概率图（GeoTIFF），多个文件或多波段堆栈时先集成融合')
     parser.add_argument('--out_shp', type=str, required=True, help='输出矢量边界文件（Shapefile）')
-    args = parser.parse_args()
+    parser.add_argument('--checkpoint_dir', type=str, default=None, help='中间结果检查点目录（可选，用于断点续跑）')
+    parser.add_argument('--mask_tif', type=str, default=None, help='耕地掩膜（可选，用于计算地块耕地占比，网格不一致时自动 warp 到输入网格）')
+    parser.add_argument('--compress', type=str.upper, choices=RASTER_COMPRESS_CHOICES, default='DEFLATE', help='标签栅格压缩方式')
+    parser.add_argument('--blocksize', type=int, default=512, help='标签栅格分块大小（像素）')
+    parser.add_argument('--cog', action='store_true', help='输出 Cloud Optimized GeoTIFF（含金字塔）')
+    parser.add_argument('--crop_threshold', type=float, default=None, help='融合过滤的耕地占比阈值（0~1，可选，需 --mask_tif）')
+    parser.add_argument('--fusion', type=str, choices=FUSION_METHODS, default='mean', help='多个边缘概率图的融合方式')
+    args = parser.parse_args(argv)
 
-    main(args.in_raster,args.out_shp)
+    main(args.in_raster,args.out_shp, checkpoint_dir=args.checkpoint_dir, mask_tif=args.mask_tif,
+         compress=args.compress, blocksize=args.blocksize, cog=args.cog, crop_threshold=args.crop_threshold,
+         fusion=args.fusion, **overrides)
 
+
+if __name__ == '__main__':
+    cli_main()